@@ -1,74 +1,535 @@
-from flask import Flask, request, jsonify, send_file
-from flask_bcrypt import Bcrypt
+from flask import Blueprint, Flask, Response, current_app, g, request, jsonify, send_file, stream_with_context
 from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
 from flask_cors import CORS
 from dotenv import load_dotenv
+import click
+import contextvars
+import functools
+import itertools
 import os
-from pymongo import MongoClient
-import google.generativeai as genai
-from datetime import datetime, timezone
+import re
+import json
+from pymongo import UpdateOne
+from datetime import datetime, timedelta, timezone
 from bson import ObjectId
-import requests
 from io import BytesIO
-import uuid
 import tempfile
-
-# Load environment variables
-load_dotenv()
-
-app = Flask(__name__)
-app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'default-secret-key')
-CORS(app)
-CLIENT_ID = os.getenv("CLIENT_ID")
-CLIENT_SECRET = os.getenv("CLIENT_SECRET")
-TOKEN_URL = "https://oauth.fatsecret.com/connect/token"
-
-
-#Getting access token for FatSecret API
-def get_access_token():
+import base64
+import orjson
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from archive import ConversationArchive
+from audio_cache import AudioCache
+from export import UserExport
+from http_client import get_upstream, upstream_stats
+from indexes import check_query_plans, ensure_indexes
+from lazy import LazyObject, memoized
+from metrics import MetricsRegistry, server_timing_header, start_request_timings
+from mongo_pool import LazyCollection, MongoPool
+from ownership_cache import ConferenceOwnershipCache
+from passwords import HostSlots, PasswordHasher
+from rate_limit import (
+    ConcurrencyLimits, LimitExceeded, MongoWindowStore, Overloaded, RateLimiter, parse_concurrency_limits, parse_rate_limits
+)
+from response_cache import ResponseCache
+from token_cache import TokenCache
+from write_behind import WriteBehindQueue
+
+# Routes live on this blueprint; create_app() registers it. Clients and caches
+# below are LazyObjects: nothing connects or reads its settings until first
+# used, so importing this module stays cheap.
+api = Blueprint("api", __name__, cli_group=None)
+
+# JWT is bound to the app in create_app
+jwt = JWTManager()
+
+# bcrypt runs in a small process pool so login bursts cannot occupy every request thread,
+# and at most PASSWORD_HASH_HOST_SLOTS hashes run at once across all workers on the host
+# (default: half the cores). Changing BCRYPT_LOG_ROUNDS rehashes each password at its next login
+password_hasher = LazyObject(lambda: PasswordHasher(
+    rounds=int(os.getenv("BCRYPT_LOG_ROUNDS", "12")),
+    workers=int(os.getenv("PASSWORD_HASH_WORKERS", "1")),
+    max_pending=int(os.getenv("PASSWORD_HASH_MAX_PENDING", "4")),
+    timeout=float(os.getenv("PASSWORD_HASH_TIMEOUT", "10")),
+    host_slots=HostSlots(
+        os.getenv("PASSWORD_HASH_LOCK_DIR", os.path.join(tempfile.gettempdir(), "vision_forage_password_slots")),
+        int(os.getenv("PASSWORD_HASH_HOST_SLOTS", str(max(1, (os.cpu_count() or 2) // 2))))
+    )
+))
+
+# Per-route and per-stage latency, served at /metrics
+metrics = MetricsRegistry(namespace="vision_forage")
+
+# In-flight calls allowed per upstream (per worker) and callers that may queue for a slot,
+# as "name=max_concurrent:max_waiting"; UPSTREAM_CONCURRENCY overrides entries
+DEFAULT_UPSTREAM_CONCURRENCY = "gemini=16:32,elevenlabs=8:16,fatsecret=16:32"
+upstream_limits = LazyObject(lambda: ConcurrencyLimits(
+    {
+        **parse_concurrency_limits(DEFAULT_UPSTREAM_CONCURRENCY),
+        **parse_concurrency_limits(os.getenv("UPSTREAM_CONCURRENCY"))
+    },
+    wait_timeout=float(os.getenv("UPSTREAM_QUEUE_TIMEOUT_MS", "2000")) / 1000
+))
+
+# Pooled HTTP clients for the FatSecret hosts
+fatsecret_oauth_client = LazyObject(lambda: get_upstream("fatsecret_oauth"))
+fatsecret_client = LazyObject(lambda: get_upstream("fatsecret"))
+
+
+#Requesting a new access token for FatSecret API
+def request_access_token():
+    config = current_app.config
     data = {
         "grant_type": "client_credentials",
-        "client_id": CLIENT_ID,
-        "client_secret": CLIENT_SECRET,
+        "client_id": config["FATSECRET_CLIENT_ID"],
+        "client_secret": config["FATSECRET_CLIENT_SECRET"],
         "scope": "basic"
     }
-    response = requests.post(TOKEN_URL, data=data)
+    # Asking for another client_credentials token is safe to retry
+    response = fatsecret_oauth_client.post(config["FATSECRET_TOKEN_URL"], data=data, idempotent=True)
     if response.status_code == 200:
         print("API fetches successfully")
-        return response.json().get("access_token")
+        token_data = response.json()
+        return token_data.get("access_token"), token_data.get("expires_in", 0)
     else:
-        return None
+        return None, 0
+
+
+# The token is shared by every worker on the host through this file
+fatsecret_token_cache = LazyObject(lambda: TokenCache(
+    request_access_token,
+    os.getenv("FATSECRET_TOKEN_CACHE", os.path.join(tempfile.gettempdir(), "fatsecret_token.json")),
+    refresh_margin=int(os.getenv("FATSECRET_TOKEN_REFRESH_MARGIN", "300"))
+))
+
+
+#Getting access token for FatSecret API
+def get_access_token():
+    return fatsecret_token_cache.get()
+
+
+# FatSecret error codes meaning the access token is invalid or expired
+FATSECRET_TOKEN_ERRORS = {13, 14}
+
+
+def is_empty_food_result(data):
+    """True when a FatSecret response found nothing for the query"""
+    if "foods" in data:
+        return not data["foods"].get("food")
+    if "suggestions" in data:
+        return not (data["suggestions"] or {}).get("suggestion")
+    return not data
+
 
+# Food data is essentially static, so responses can be cached for a long time
+nutrition_cache = LazyObject(lambda: ResponseCache(
+    max_entries=int(os.getenv("NUTRITION_CACHE_SIZE", "4096")),
+    ttl=int(os.getenv("NUTRITION_CACHE_TTL", "86400")),
+    negative_ttl=int(os.getenv("NUTRITION_CACHE_NEGATIVE_TTL", "600")),
+    is_empty=is_empty_food_result,
+    is_cacheable=lambda data: isinstance(data, dict) and "error" not in data
+))
+
+
+def fatsecret_request(method, params, query):
+    """Call a FatSecret API method, serving repeated queries from the cache"""
+    normalized_query = " ".join(str(query or "").lower().split())
+    api_url = current_app.config["FATSECRET_API_URL"]
+
+    def load():
+        token = get_access_token()
+        headers = {
+            'Authorization': f'Bearer {token}'
+        }
+        with upstream_limits.slot("fatsecret"), metrics.span("fatsecret"):
+            response = fatsecret_client.get(
+                api_url,
+                params={'method': method, 'format': 'json', **params},
+                headers=headers
+            )
+        data = response.json()
+        error = data.get("error") if isinstance(data, dict) else None
+        if error and error.get("code") in FATSECRET_TOKEN_ERRORS:
+            fatsecret_token_cache.invalidate()
+        return data
+
+    return nutrition_cache.get_or_load((method, normalized_query), load)
 
-# Initialize bcrypt and JWT
-bcrypt = Bcrypt(app)
-jwt = JWTManager(app)
 
 # MongoDB connection setup
-MONGO_URI = os.getenv("MONGO_URL")
-client = MongoClient(MONGO_URI)
-db = client["mental_health"]
-users_collection = db["users"]
-chat_collection = db["chat_history"]
-voice_profiles = db["voice_profiles"]
-user_preferences = db["user_preferences"]
-feedback_collection = db["feedback"]
-conferences_collection = db["conferences"]
-messages_collection = db["messages"]
+MONGO_DB_NAME = "mental_health"
+# One client per process, opened on first use so gunicorn --preload forks safely
+mongo_pool = LazyObject(lambda: MongoPool(os.getenv("MONGO_URL")))
+
+
+def get_db():
+    return mongo_pool.database(MONGO_DB_NAME)
+
+
+users_collection = LazyCollection(mongo_pool, MONGO_DB_NAME, "users")
+chat_collection = LazyCollection(mongo_pool, MONGO_DB_NAME, "chat_history")
+voice_profiles = LazyCollection(mongo_pool, MONGO_DB_NAME, "voice_profiles")
+user_preferences = LazyCollection(mongo_pool, MONGO_DB_NAME, "user_preferences")
+feedback_collection = LazyCollection(mongo_pool, MONGO_DB_NAME, "feedback")
+conferences_collection = LazyCollection(mongo_pool, MONGO_DB_NAME, "conferences")
+messages_collection = LazyCollection(mongo_pool, MONGO_DB_NAME, "messages")
+message_archives = LazyCollection(mongo_pool, MONGO_DB_NAME, "message_archives")
+
+# Compressed cold storage for idle conferences (flask archive-conversations)
+conversation_archive = ConversationArchive(conferences_collection, messages_collection, message_archives)
+
+# Per-user request budgets as "name=per_minute:burst"; RATE_LIMITS overrides entries
+DEFAULT_RATE_LIMITS = "chat=30:10,voice_upload=5:2,nutrition=300:60"
+
+
+@memoized
+def get_rate_limiter():
+    """Opt-in per-user rate limits; shared by all workers with RATE_LIMIT_STORE=mongo. None when off"""
+    if os.getenv("RATE_LIMIT_ENABLED", "false").lower() != "true":
+        return None
+    store = None
+    if os.getenv("RATE_LIMIT_STORE", "memory").lower() == "mongo":
+        store = MongoWindowStore(LazyCollection(mongo_pool, MONGO_DB_NAME, "rate_limits"))
+    return RateLimiter(
+        {**parse_rate_limits(DEFAULT_RATE_LIMITS), **parse_rate_limits(os.getenv("RATE_LIMITS"))},
+        store=store
+    )
+
+
+def rate_limited(name, per_user=True):
+    """Spend one of the caller's ``name`` requests before the view runs.
+
+    Callers are told apart by their JWT identity (so put this below
+    @jwt_required()), or by client address with per_user=False.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            rate_limiter = get_rate_limiter()
+            if rate_limiter is not None:
+                rate_limiter.check(name, get_jwt_identity() if per_user else request.remote_addr)
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# Streams a user's conferences, messages and feedback for /export and flask export-user
+user_export = UserExport(
+    conferences_collection, messages_collection, feedback_collection, archive=conversation_archive
+)
+
+# Per-process cache of conference ownership used by the authorization checks
+ownership_cache = LazyObject(lambda: ConferenceOwnershipCache(
+    conferences_collection,
+    ttl=int(os.getenv("OWNERSHIP_CACHE_TTL", "30"))
+))
+
+
+def create_gemini_model():
+    # Imported here: the google-api/grpc stack is only loaded by workers that chat
+    import google.generativeai as genai
+
+    genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+    return genai.GenerativeModel(os.getenv("GEMINI_MODEL", "gemini-1.5-flash"))
+
 
 # Configure Google Gemini
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-genai.configure(api_key=GEMINI_API_KEY)
-model = genai.GenerativeModel('gemini-1.5-flash')
+model = LazyObject(create_gemini_model)
+
+# Synthesis and voice cloning can take a while, so allow a longer read timeout
+elevenlabs_client = LazyObject(lambda: get_upstream(
+    "elevenlabs",
+    read_timeout=float(os.getenv("ELEVENLABS_READ_TIMEOUT", "30"))
+))
+VOICE_SETTINGS = {
+    "stability": 0.5,
+    "similarity_boost": 0.75
+}
+
+# Synthesized replies are cached on disk by (voice, text, settings) under a byte budget
+audio_cache = LazyObject(lambda: AudioCache(
+    os.getenv("AUDIO_CACHE_DIR", os.path.join(tempfile.gettempdir(), "vision_forage_audio")),
+    max_bytes=int(os.getenv("AUDIO_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+))
+AUDIO_CHUNK_SIZE = 4096
+AUDIO_MAX_AGE = 24 * 60 * 60
+# A fetch of a clip another request is synthesizing waits this long for it, then gets a 503
+AUDIO_PENDING_WAIT = float(os.getenv("AUDIO_PENDING_WAIT_SECONDS", "15"))
+
+# Replies are capped at this many words before being returned or spoken
+MAX_RESPONSE_WORDS = 100
+
+
+@memoized
+def get_semantic_cache():
+    """Opt-in cache of replies for near-duplicate messages, in front of Gemini; None when off"""
+    if os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() != "true":
+        return None
+    from semantic_cache import SemanticCache, load_sentence_embedder
+
+    return SemanticCache(
+        load_sentence_embedder(os.getenv("SEMANTIC_CACHE_MODEL", "all-MiniLM-L6-v2")),
+        threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92")),
+        ttl=int(os.getenv("SEMANTIC_CACHE_TTL", str(24 * 60 * 60))),
+        max_entries=int(os.getenv("SEMANTIC_CACHE_SIZE", "2048"))
+    )
+
+
+# Chat history paging
+MAX_HISTORY_PAGE_SIZE = 200
+HISTORY_BATCH_SIZE = 500
+
+# Runs independent blocking steps of a request (Mongo lookups, upserts) concurrently
+io_executor = LazyObject(lambda: ThreadPoolExecutor(
+    max_workers=int(os.getenv("IO_EXECUTOR_WORKERS", "16")),
+    thread_name_prefix="io"
+))
+
 
-# ElevenLabs voice API configuration
-ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY", "sk_0e6a4b11b085079f89561266e6270d9816fb0c5e66a25570")
-DEFAULT_VOICE_ID = os.getenv("DEFAULT_VOICE_ID", "SLVLJ4RCTvobsWx1j1Ds")  # Default voice ID
-ELEVENLABS_API_URL = "https://api.elevenlabs.io/v1"
+@memoized
+def get_write_behind():
+    """Optional batched inserts for append-only records that are not read back at once
+    (feedback); None when off.
 
+    The ids are assigned up front so responses can still return them immediately.
+    """
+    if os.getenv("WRITE_BEHIND_ENABLED", "false").lower() != "true":
+        return None
+    return WriteBehindQueue(
+        max_batch=int(os.getenv("WRITE_BEHIND_MAX_BATCH", "500")),
+        flush_interval=float(os.getenv("WRITE_BEHIND_FLUSH_MS", "200")) / 1000,
+        max_queue=int(os.getenv("WRITE_BEHIND_MAX_QUEUE", "10000"))
+    )
+
+
+def insert_records(collection, documents):
+    """Insert append-only documents, through the write-behind queue when enabled.
+
+    Returns the ids of the documents in order.
+    """
+    write_behind = get_write_behind()
+    if write_behind is not None:
+        return write_behind.insert_many(collection, documents)
+    if len(documents) == 1:
+        return [collection.insert_one(documents[0]).inserted_id]
+    return collection.insert_many(documents).inserted_ids
+
+
+def build_chat_prompt(user_input, output_mode):
+    """Build the empathetic chatbot prompt, with voice-friendly instructions if needed"""
+    if output_mode == "voice":
+        return (
+            "You are a supportive and empathetic chatbot designed to provide comfort, encouragement, "
+            "and thoughtful responses to users, particularly women, on emotional and mental well-being topics. "
+            "Your goal is to create a safe space for users to express themselves while offering appropriate guidance. "
+            "Since your response will be read aloud by text-to-speech, use natural, conversational language "
+            "with good pacing. Avoid complex sentences or unusual characters that might be difficult to pronounce. "
+            "Respond concisely (within 50 words) while maintaining warmth and reassurance.\n\nUser: " + user_input
+        )
+    return (
+        "You are a supportive and empathetic chatbot designed to provide comfort, encouragement, "
+        "and thoughtful responses to users, particularly women, on emotional and mental well-being topics. "
+        "Your goal is to create a safe space for users to express themselves while offering appropriate guidance. "
+        "Respond concisely (within 30 words) while maintaining warmth and reassurance.\n\nUser: " + user_input
+    )
+
+
+@metrics.timed("voice_lookup")
+def resolve_voice_id(user_email, use_user_voice):
+    """Pick the ElevenLabs voice a reply should be spoken with"""
+    # Get user's voice profile
+    voice_profile = voice_profiles.find_one({"email": user_email})
 
+    if use_user_voice and voice_profile and "voiceId" in voice_profile:
+        # Generate speech using user's voice profile
+        return voice_profile["voiceId"]
+    # Use default voice
+    return current_app.config["DEFAULT_VOICE_ID"]
 
-@app.route('/feedback', methods=['POST'])
+
+@metrics.timed("preferences_upsert")
+def store_output_preferences(user_email, output_mode, use_user_voice):
+    user_preferences.update_one(
+        {"email": user_email},
+        {"$set": {"outputMode": output_mode, "useUserVoice": use_user_voice}},
+        upsert=True
+    )
+
+
+def start_chat_side_tasks(user_email, output_mode, use_user_voice):
+    """Run the lookups a chat turn needs alongside generation.
+
+    Returns futures for the preference upsert and, in voice mode, the voice id.
+    """
+    # Copying the context lets the tasks' stage timings reach this request's Server-Timing
+    preferences_future = io_executor.submit(
+        contextvars.copy_context().run, store_output_preferences, user_email, output_mode, use_user_voice
+    )
+    voice_future = None
+    if output_mode == "voice":
+        voice_future = io_executor.submit(
+            contextvars.copy_context().run, resolve_voice_id, user_email, use_user_voice
+        )
+    return preferences_future, voice_future
+
+
+def synthesize_reply_audio(voice_id, text):
+    """Generate speech for a reply and return the URL it can be fetched from"""
+    # Reuse the clip if this exact text was already spoken with this voice
+    key = AudioCache.key_for(voice_id, text, VOICE_SETTINGS)
+    filename = AudioCache.filename_for(key)
+    if audio_cache.get(key):
+        return f"/api/audio/{filename}"
+
+    if current_app.config["AUDIO_STREAMING"]:
+        # Defer synthesis to the audio request so playback starts with the first chunk
+        audio_cache.add_pending(key, {"voice_id": voice_id, "text": text})
+        return f"/api/audio/{filename}"
+
+    # Generate speech with ElevenLabs
+    with metrics.span("elevenlabs"):
+        audio_data = generate_speech_with_elevenlabs(text, voice_id)
+    if not audio_data:
+        return None
+
+    with metrics.span("audio_write"):
+        audio_cache.put(key, audio_data)
+    return f"/api/audio/{filename}"
+
+
+def stream_gemini(prompt):
+    """Yield Gemini's streamed chunks; closing the generator stops the generation upstream"""
+    response = model.generate_content(prompt, stream=True)
+    try:
+        yield from response
+    finally:
+        # genai keeps the transport stream in _iterator: gRPC streams cancel, REST ones close
+        for stream in (getattr(response, "_iterator", None), response):
+            stop = getattr(stream, "cancel", None) or getattr(stream, "close", None)
+            if stop is not None:
+                stop()
+                break
+
+
+def lookup_cached_reply(output_mode, user_input):
+    """Return (cached reply or None, message embedding) from the semantic cache"""
+    semantic_cache = get_semantic_cache()
+    if semantic_cache is None:
+        return None, None
+    try:
+        with metrics.span("semantic_cache"):
+            return semantic_cache.lookup(output_mode, user_input)
+    except Exception as e:
+        print(f"Semantic cache lookup failed: {str(e)}")
+        return None, None
+
+
+def store_cached_reply(output_mode, user_input, reply, message_vector):
+    semantic_cache = get_semantic_cache()
+    if semantic_cache is None or not reply:
+        return
+    try:
+        semantic_cache.store(output_mode, user_input, reply, message_vector)
+    except Exception as e:
+        print(f"Semantic cache store failed: {str(e)}")
+
+
+def count_conference_messages(conference_id, added, touched_at=None):
+    """Adjust a conference's message_count (and optionally touch updated_at) in one update.
+
+    Conferences created before message_count existed are left without it, so
+    get_conferences keeps counting them from the messages collection instead
+    of an $inc starting them at 0.
+    """
+    fields = {
+        # {$gt: [field, null]} is false for a missing field, so those stay missing
+        'message_count': {'$cond': [
+            {'$gt': ['$message_count', None]},
+            {'$add': ['$message_count', added]},
+            '$$REMOVE'
+        ]}
+    }
+    if touched_at is not None:
+        fields['updated_at'] = touched_at
+    conferences_collection.update_one({'_id': ObjectId(conference_id)}, [{'$set': fields}])
+
+
+@metrics.timed("persist")
+def persist_turn(user_email, conference_id, user_input, reply, started_at):
+    """Store the user message and bot reply of one chat turn and touch the conference.
+
+    Returns the ids of the stored user and bot messages.
+    """
+    now = datetime.now(timezone.utc)
+    # Written synchronously: the ids are returned to the client and read back right away
+    message_ids = messages_collection.insert_many([
+        {
+            "email": user_email,
+            "conference_id": conference_id,
+            "content": user_input,
+            "role": "user",
+            "timestamp": started_at
+        },
+        {
+            "email": user_email,
+            "conference_id": conference_id,
+            "content": reply,
+            "role": "bot",
+            "timestamp": now
+        }
+    ]).inserted_ids
+
+    # Update conference updated_at and message count
+    count_conference_messages(conference_id, 2, touched_at=now)
+
+    user_message_id, bot_message_id = (str(_id) for _id in message_ids)
+    return user_message_id, bot_message_id
+
+
+def json_default(value):
+    """Serialize the BSON types orjson does not handle natively"""
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError
+
+
+def dump_json(data):
+    # Mongo returns naive datetimes that are in UTC
+    return orjson.dumps(data, default=json_default, option=orjson.OPT_NAIVE_UTC)
+
+
+def stream_json_array(documents):
+    """Serialize documents into a JSON array one at a time"""
+    yield b"["
+    for index, document in enumerate(documents):
+        if index:
+            yield b","
+        yield dump_json(document)
+    yield b"]"
+
+
+def encode_history_cursor(message):
+    """Build the opaque paging token for the (timestamp, _id) of a message"""
+    raw = f"{message['timestamp'].isoformat()}|{message['_id']}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_history_cursor(token):
+    try:
+        raw = base64.urlsafe_b64decode(token.encode("ascii")).decode("utf-8")
+        timestamp, message_id = raw.split("|")
+        return datetime.fromisoformat(timestamp), ObjectId(message_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def sse_event(event, data):
+    """Format a single Server-Sent Event frame"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@api.route('/feedback', methods=['POST'])
 @jwt_required()
 def feedback():
     try:
@@ -82,12 +543,7 @@ def feedback():
             return jsonify({"error": "Conference ID is required"}), 400
         
         # Verify conference belongs to user
-        conference = conferences_collection.find_one({
-            '_id': ObjectId(conference_id),
-            'user_email': user_email
-        })
-        
-        if not conference:
+        if not ownership_cache.owns(user_email, conference_id):
             return jsonify({'error': 'Conference not found'}), 404
 
         feedback_data = {
@@ -98,25 +554,20 @@ def feedback():
             "timestamp": datetime.now(timezone.utc)
         }
 
-        feedback_collection.insert_one(feedback_data)
+        insert_records(feedback_collection, [feedback_data])
         return jsonify({"message": "Feedback recorded successfully"}), 201
 
     except Exception as e:
         print(f"Error in feedback endpoint: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
-@app.route('/get_feedback/<conference_id>', methods=['GET'])
+@api.route('/get_feedback/<conference_id>', methods=['GET'])
 @jwt_required()
 def get_feedback(conference_id):
     user_email = get_jwt_identity()
     
     # Verify conference belongs to user
-    conference = conferences_collection.find_one({
-        '_id': ObjectId(conference_id),
-        'user_email': user_email
-    })
-    
-    if not conference:
+    if not ownership_cache.owns(user_email, conference_id):
         return jsonify({'error': 'Conference not found'}), 404
     
     feedback_list = list(feedback_collection.find(
@@ -129,32 +580,22 @@ def get_feedback(conference_id):
 
 
 # API Endpoint to fetch food details
-@app.route('/api/nutrition/get', methods=['GET'])
+@api.route('/api/nutrition/get', methods=['GET'])
+@rate_limited("nutrition", per_user=False)
 def get_food():
     try:
         food_id = request.args.get('food_id')
-        token = get_access_token()
-        
-        params = {
-            'method': 'food.get',
-            'food_id': food_id,
-            'format': 'json'
-        }
-        
-        headers = {
-            'Authorization': f'Bearer {token}'
-        }
-        
-        API_BASE_URL = "https://platform.fatsecret.com/rest/server.api"
-        response = requests.get(API_BASE_URL, params=params, headers=headers)
-        return jsonify(response.json())
+        return jsonify(fatsecret_request('food.get', {'food_id': food_id}, food_id))
     
+    except LimitExceeded:
+        raise
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
-@app.route("/gemini_chat", methods=["POST"])
+@api.route("/gemini_chat", methods=["POST"])
 @jwt_required()
+@rate_limited("chat")
 def gemini_chat():
     try:
         data = request.json
@@ -163,106 +604,198 @@ def gemini_chat():
         use_user_voice = data.get("useUserVoice", False)
         conference_id = data.get("conference_id")
         user_email = get_jwt_identity()
+        started_at = datetime.now(timezone.utc)
 
         if not user_input or not conference_id:
             return jsonify({"error": "Message and conference_id are required"}), 400
 
         # Verify conference belongs to user
-        conference = conferences_collection.find_one({
-            '_id': ObjectId(conference_id),
-            'user_email': user_email
-        })
-        
-        if not conference:
+        with metrics.span("ownership"):
+            owns_conference = ownership_cache.owns(user_email, conference_id)
+        if not owns_conference:
             return jsonify({"error": "Conference not found"}), 404
 
-        # Store user preference in database
-        user_preferences.update_one(
-            {"email": user_email},
-            {"$set": {"outputMode": output_mode, "useUserVoice": use_user_voice}},
-            upsert=True
-        )
+        prompt = build_chat_prompt(user_input, output_mode)
 
-        # Empathetic and supportive chatbot prompt with voice-friendly instructions if needed
-        if output_mode == "voice":
-            prompt = (
-                "You are a supportive and empathetic chatbot designed to provide comfort, encouragement, "
-                "and thoughtful responses to users, particularly women, on emotional and mental well-being topics. "
-                "Your goal is to create a safe space for users to express themselves while offering appropriate guidance. "
-                "Since your response will be read aloud by text-to-speech, use natural, conversational language "
-                "with good pacing. Avoid complex sentences or unusual characters that might be difficult to pronounce. "
-                "Respond concisely (within 50 words) while maintaining warmth and reassurance.\n\nUser: " + user_input
-            )
-        else:
-            prompt = (
-                "You are a supportive and empathetic chatbot designed to provide comfort, encouragement, "
-                "and thoughtful responses to users, particularly women, on emotional and mental well-being topics. "
-                "Your goal is to create a safe space for users to express themselves while offering appropriate guidance. "
-                "Respond concisely (within 30 words) while maintaining warmth and reassurance.\n\nUser: " + user_input
-            )
+        # Near-duplicate messages can reuse an earlier reply instead of calling Gemini
+        short_response, message_vector = lookup_cached_reply(output_mode, user_input)
 
-        responses = model.generate_content(prompt, stream=True)
+        # Admitted before any side effects, so a 503 leaves nothing behind
+        release_gemini = upstream_limits.acquire("gemini") if short_response is None else (lambda: None)
 
-        full_response = ""
-        for response in responses:
-            full_response += response.text
+        try:
+            # Store user preference and look up the voice while the reply is generated
+            preferences_future, voice_future = start_chat_side_tasks(user_email, output_mode, use_user_voice)
+
+            if short_response is None:
+                generation_started = time.perf_counter()
+                responses = metrics.timed_stream(
+                    stream_gemini(prompt),
+                    "gemini_first_chunk", "gemini", started=generation_started
+                )
+
+                full_response = ""
+                for response in responses:
+                    full_response += response.text
+        finally:
+            release_gemini()
+
+        if short_response is None:
+            # Limit response to 100 words
+            short_response = " ".join(full_response.split()[:MAX_RESPONSE_WORDS])
+            store_cached_reply(output_mode, user_input, short_response, message_vector)
 
-        # Limit response to 100 words
-        short_response = " ".join(full_response.split()[:100])
+        # Store both sides of the turn so the client does not need /store_message
+        user_message_id, bot_message_id = persist_turn(
+            user_email, conference_id, user_input, short_response, started_at
+        )
+        preferences_future.result()
 
         # If using voice output mode with user's voice, generate audio file
         audio_url = None
         if output_mode == "voice":
-            # Get user's voice profile
-            voice_profile = voice_profiles.find_one({"email": user_email})
-            
-            if use_user_voice and voice_profile and "voiceId" in voice_profile:
-                # Generate speech using user's voice profile
-                voice_id = voice_profile["voiceId"]
-            else:
-                # Use default voice
-                voice_id = DEFAULT_VOICE_ID
-                
-            # Generate speech with ElevenLabs
-            audio_data = generate_speech_with_elevenlabs(short_response, voice_id)
-            
-            if audio_data:
-                # Save the audio file
-                filename = f"{uuid.uuid4()}.mp3"
-                file_path = os.path.join(tempfile.gettempdir(), filename)
-                
-                with open(file_path, "wb") as f:
-                    f.write(audio_data)
-                
-                audio_url = f"/api/audio/{filename}"
+            audio_url = synthesize_reply_audio(voice_future.result(), short_response)
         
         return jsonify({
             "response": short_response,
             "outputMode": output_mode,
             "audioUrl": audio_url,
-            "conference_id": conference_id
+            "conference_id": conference_id,
+            "user_message_id": user_message_id,
+            "bot_message_id": bot_message_id
         })
 
+    except LimitExceeded:
+        raise
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@api.route("/gemini_chat/stream", methods=["POST"])
+@jwt_required()
+@rate_limited("chat")
+def gemini_chat_stream():
+    """Stream the reply as Server-Sent Events while Gemini generates it.
+
+    Emits a ``chunk`` event per piece of text, then a ``done`` event carrying the
+    full (word-capped) response, the conference id, the stored message ids and
+    the audio URL.
+    """
+    try:
+        data = request.json
+        user_input = data.get("message", "")
+        output_mode = data.get("outputMode", "text")
+        use_user_voice = data.get("useUserVoice", False)
+        conference_id = data.get("conference_id")
+        user_email = get_jwt_identity()
+        started_at = datetime.now(timezone.utc)
+
+        if not user_input or not conference_id:
+            return jsonify({"error": "Message and conference_id are required"}), 400
+
+        # Verify conference belongs to user
+        with metrics.span("ownership"):
+            owns_conference = ownership_cache.owns(user_email, conference_id)
+        if not owns_conference:
+            return jsonify({"error": "Conference not found"}), 404
+
+        prompt = build_chat_prompt(user_input, output_mode)
+
+        # Near-duplicate messages can reuse an earlier reply instead of calling Gemini
+        short_response, message_vector = lookup_cached_reply(output_mode, user_input)
+
+        # Admit a Gemini stream before it starts so an overloaded upstream is a 503, not an SSE error
+        release_gemini = upstream_limits.acquire("gemini") if short_response is None else (lambda: None)
+
+        # Store user preference and look up the voice while the reply is generated
+        try:
+            preferences_future, voice_future = start_chat_side_tasks(user_email, output_mode, use_user_voice)
+        except Exception:
+            release_gemini()
+            raise
+
+    except LimitExceeded:
+        raise
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+    def generate():
+        nonlocal short_response
+        full_response = ""
+        try:
+            if short_response is not None:
+                yield sse_event("chunk", {"text": short_response})
+            else:
+                generation_started = time.perf_counter()
+                responses = metrics.timed_stream(
+                    stream_gemini(prompt),
+                    "gemini_first_chunk", "gemini", started=generation_started
+                )
+                for response in responses:
+                    previous_length = len(full_response)
+                    full_response += response.text
+                    words = list(re.finditer(r"\S+", full_response))
+                    if len(words) > MAX_RESPONSE_WORDS:
+                        # Send up to the end of the last allowed word and stop generating
+                        cut_at = words[MAX_RESPONSE_WORDS - 1].end()
+                        if cut_at > previous_length:
+                            yield sse_event("chunk", {"text": full_response[previous_length:cut_at]})
+                        break
+                    if response.text:
+                        yield sse_event("chunk", {"text": response.text})
+                responses.close()
+
+                short_response = " ".join(full_response.split()[:MAX_RESPONSE_WORDS])
+                store_cached_reply(output_mode, user_input, short_response, message_vector)
+            release_gemini()
+
+            user_message_id, bot_message_id = persist_turn(
+                user_email, conference_id, user_input, short_response, started_at
+            )
+            preferences_future.result()
+
+            audio_url = None
+            if output_mode == "voice":
+                audio_url = synthesize_reply_audio(voice_future.result(), short_response)
+
+            yield sse_event("done", {
+                "response": short_response,
+                "outputMode": output_mode,
+                "audioUrl": audio_url,
+                "conference_id": conference_id,
+                "user_message_id": user_message_id,
+                "bot_message_id": bot_message_id
+            })
+
+        except Exception as e:
+            print(f"Error streaming chat response: {str(e)}")
+            yield sse_event("error", {"error": str(e)})
+
+    response = Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+    # Also frees the slot if the client goes away before the stream is read
+    response.call_on_close(release_gemini)
+    return response
+
 def generate_speech_with_elevenlabs(text, voice_id):
     """Generate speech using ElevenLabs API"""
     try:
-        url = f"{ELEVENLABS_API_URL}/text-to-speech/{voice_id}"
+        url = f"{current_app.config['ELEVENLABS_API_URL']}/text-to-speech/{voice_id}"
         headers = {
             "Content-Type": "application/json",
-            "xi-api-key": ELEVENLABS_API_KEY
+            "xi-api-key": current_app.config["ELEVENLABS_API_KEY"]
         }
         payload = {
             "text": text,
-            "voice_settings": {
-                "stability": 0.5,
-                "similarity_boost": 0.75
-            }
+            "voice_settings": VOICE_SETTINGS
         }
         
-        response = requests.post(url, json=payload, headers=headers)
+        # Synthesis is billed per call, so it is only retried when it was rejected or never sent
+        with upstream_limits.slot("elevenlabs"):
+            response = elevenlabs_client.post(url, json=payload, headers=headers, billed=True)
         
         if response.status_code == 200:
             return response.content  # Return audio binary data
@@ -273,76 +806,163 @@ def generate_speech_with_elevenlabs(text, voice_id):
     except Exception as e:
         print(f"Error generating speech: {str(e)}")
         return None
+
+
+def stream_speech_with_elevenlabs(text, voice_id):
+    """Start a streaming ElevenLabs synthesis and return the open response"""
+    try:
+        url = f"{current_app.config['ELEVENLABS_API_URL']}/text-to-speech/{voice_id}/stream"
+        headers = {
+            "Content-Type": "application/json",
+            "xi-api-key": current_app.config["ELEVENLABS_API_KEY"]
+        }
+        payload = {
+            "text": text,
+            "voice_settings": VOICE_SETTINGS
+        }
+
+        response = elevenlabs_client.post(url, json=payload, headers=headers, billed=True, stream=True)
+
+        if response.status_code == 200:
+            return response
+        else:
+            print(f"ElevenLabs API error: {response.status_code} - {response.text}")
+            response.close()
+            return None
+
+    except Exception as e:
+        print(f"Error streaming speech: {str(e)}")
+        return None
     
 
 
 
-@app.route('/api/nutrition/search', methods=['GET'])
+@api.route('/api/nutrition/search', methods=['GET'])
+@rate_limited("nutrition", per_user=False)
 def search_food():
     try:
         query = request.args.get('query')
-        token = get_access_token()
-        
-        params = {
-            'method': 'foods.search',
-            'search_expression': query,
-            'format': 'json'
-        }
-        
-        headers = {
-            'Authorization': f'Bearer {token}'
-        }
-        
-        API_BASE_URL = "https://platform.fatsecret.com/rest/server.api"
-        response = requests.get(API_BASE_URL, params=params, headers=headers)
-        return jsonify(response.json())
+        return jsonify(fatsecret_request('foods.search', {'search_expression': query}, query))
     
+    except LimitExceeded:
+        raise
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
 
 
-@app.route('/api/nutrition/autocomplete', methods=['GET'])
+@api.route('/api/nutrition/autocomplete', methods=['GET'])
+@rate_limited("nutrition", per_user=False)
 def autocomplete_food():
     try:
         query = request.args.get('query')
-        token = get_access_token()
-        
-        params = {
-            'method': 'foods.autocomplete',
-            'expression': query,
-            'format': 'json'
-        }
-        
-        headers = {
-            'Authorization': f'Bearer {token}'
-        }
-        
-        API_BASE_URL = "https://platform.fatsecret.com/rest/server.api"
-        response = requests.get(API_BASE_URL, params=params, headers=headers)
-        return jsonify(response.json())
+        return jsonify(fatsecret_request('foods.autocomplete', {'expression': query}, query))
     
+    except LimitExceeded:
+        raise
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+@api.route('/api/nutrition/cache_stats', methods=['GET'])
+def nutrition_cache_stats():
+    return jsonify(nutrition_cache.stats()), 200
+
 
 
-@app.route("/api/audio/<filename>", methods=["GET"])
+
+@api.route("/api/audio/<filename>", methods=["GET"])
 def get_audio_file(filename):
-    """Serve the generated audio file"""
-    file_path = os.path.join(tempfile.gettempdir(), filename)
-    if os.path.exists(file_path):
-        return send_file(file_path, mimetype="audio/mpeg")
-    else:
+    """Serve the generated audio file, synthesizing it on the fly if still pending.
+
+    Only the fetch that claims a pending clip synthesizes it; concurrent
+    fetches (e.g. the <audio> element's Range probe) wait for that clip to be
+    cached and are served from disk, or get a 503 with Retry-After.
+    """
+    file_path = audio_cache.path_for(filename)
+    if not file_path:
         return jsonify({"error": "Audio file not found"}), 404
-    
 
+    def send_cached():
+        # Clips are content-addressed, so they never change once written
+        return send_file(
+            file_path,
+            mimetype="audio/mpeg",
+            conditional=True,
+            etag=True,
+            max_age=AUDIO_MAX_AGE
+        )
 
+    if os.path.exists(file_path):
+        return send_cached()
+
+    key = filename[:-len(".mp3")]
+    pending = audio_cache.claim_pending(key)
+    if not pending:
+        if not audio_cache.is_pending(key):
+            return jsonify({"error": "Audio file not found"}), 404
+        with metrics.span("audio_pending_wait"):
+            cached = audio_cache.wait_for(key, AUDIO_PENDING_WAIT)
+        if cached:
+            return send_cached()
+        raise Overloaded("audio_synthesis", max(1, round(AUDIO_PENDING_WAIT)))
+
+    # The slot is held until the clip has been streamed
+    try:
+        release_elevenlabs = upstream_limits.acquire("elevenlabs")
+    except LimitExceeded:
+        audio_cache.release_claim(key)
+        raise
+    with metrics.span("elevenlabs_stream_open"):
+        upstream = stream_speech_with_elevenlabs(pending["text"], pending["voice_id"])
+    if upstream is None:
+        release_elevenlabs()
+        audio_cache.release_claim(key)
+        return jsonify({"error": "Failed to generate audio"}), 502
+
+    chunks = audio_cache.tee(key, upstream.iter_content(chunk_size=AUDIO_CHUNK_SIZE))
+    range_from_start = request.range is None or request.range.ranges == [(0, None)]
+    if not range_from_start:
+        # A byte range of a clip that does not exist yet: finish it, then serve the range from disk
+        try:
+            for _ in chunks:
+                pass
+        finally:
+            upstream.close()
+            release_elevenlabs()
+        if not os.path.exists(file_path):
+            return jsonify({"error": "Failed to generate audio"}), 502
+        return send_cached()
+
+    def generate():
+        try:
+            yield from chunks
+        finally:
+            upstream.close()
+            release_elevenlabs()
+
+    def on_close():
+        release_elevenlabs()
+        # The client went away before streaming started; let the next fetch synthesize it
+        if not os.path.exists(file_path):
+            upstream.close()
+            audio_cache.release_claim(key)
+
+    response = Response(
+        stream_with_context(generate()),
+        mimetype="audio/mpeg",
+        headers={"Cache-Control": "no-cache"}
+    )
+    response.call_on_close(on_close)
+    return response
 
-@app.route("/upload_voice_sample", methods=["POST"])
+
+
+
+@api.route("/upload_voice_sample", methods=["POST"])
 @jwt_required()
+@rate_limited("voice_upload")
 def upload_voice_sample():
     """Upload user's voice sample to ElevenLabs and save the voice ID"""
     user_email = get_jwt_identity()
@@ -354,30 +974,32 @@ def upload_voice_sample():
     name = request.form.get('name', f"User_{user_email.split('@')[0]}")
     
     try:
-        # Save the voice sample temporarily
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.mp3')
-        voice_sample.save(temp_file.name)
-        temp_file.close()
+        # Take the ElevenLabs slot before spooling the sample to disk
+        with upstream_limits.slot("elevenlabs"):
+            # Save the voice sample temporarily
+            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.mp3')
+            voice_sample.save(temp_file.name)
+            temp_file.close()
         
-        # Upload to ElevenLabs and create voice
-        with open(temp_file.name, 'rb') as f:
-            files = {
-                'files': (os.path.basename(temp_file.name), f, 'audio/mpeg')
-            }
-            data = {
-                'name': name,
-                'description': f"Voice profile for {user_email}"
-            }
+            # Upload to ElevenLabs and create voice
+            with open(temp_file.name, 'rb') as f:
+                files = {
+                    'files': (os.path.basename(temp_file.name), f, 'audio/mpeg')
+                }
+                data = {
+                    'name': name,
+                    'description': f"Voice profile for {user_email}"
+                }
             
-            response = requests.post(
-                f"{ELEVENLABS_API_URL}/voices/add",
-                headers={"xi-api-key": ELEVENLABS_API_KEY},
-                data=data,
-                files=files
-            )
+                response = elevenlabs_client.post(
+                    f"{current_app.config['ELEVENLABS_API_URL']}/voices/add",
+                    headers={"xi-api-key": current_app.config["ELEVENLABS_API_KEY"]},
+                    data=data,
+                    files=files
+                )
         
-        # Clean up temporary file
-        os.unlink(temp_file.name)
+            # Clean up temporary file
+            os.unlink(temp_file.name)
         
         if response.status_code != 200:
             return jsonify({"error": f"ElevenLabs API error: {response.text}"}), 500
@@ -406,10 +1028,12 @@ def upload_voice_sample():
             "name": name
         })
         
+    except LimitExceeded:
+        raise
     except Exception as e:
         return jsonify({"error": f"Error creating voice profile: {str(e)}"}), 500
 
-@app.route("/get_user_voice_profile", methods=["GET"])
+@api.route("/get_user_voice_profile", methods=["GET"])
 @jwt_required()
 def get_user_voice_profile():
     """Get the user's voice profile information"""
@@ -427,7 +1051,7 @@ def get_user_voice_profile():
     })
 
 # Keep all other existing routes
-@app.route("/get_user_preferences", methods=["GET"])
+@api.route("/get_user_preferences", methods=["GET"])
 @jwt_required()
 def get_user_preferences():
     user_email = get_jwt_identity()
@@ -447,7 +1071,7 @@ def get_user_preferences():
     
     return jsonify(user_prefs) 
 
-@app.route("/update_user_preferences", methods=["POST"])
+@api.route("/update_user_preferences", methods=["POST"])
 @jwt_required()
 def update_user_preferences():
     user_email = get_jwt_identity()
@@ -464,7 +1088,41 @@ def update_user_preferences():
 
 
 
-@app.after_request
+@api.before_app_request
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    g.stage_timings = start_request_timings()
+
+
+@api.after_app_request
+def record_request_metrics(response):
+    started = g.pop("request_started", None)
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    # The URL rule keeps label cardinality bounded; streamed bodies are timed to their headers
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    metrics.observe(
+        "request_duration_seconds", elapsed, "Time until response headers, per route",
+        route=route, method=request.method
+    )
+    metrics.inc(
+        "requests_total", help_text="Requests handled, per route and status",
+        route=route, method=request.method, status=response.status_code
+    )
+    if current_app.config["SERVER_TIMING_ENABLED"]:
+        response.headers["Server-Timing"] = server_timing_header(g.stage_timings, elapsed)
+    return response
+
+
+@api.app_errorhandler(LimitExceeded)
+def limit_exceeded(e):
+    """429 for a spent per-user budget, 503 for a saturated upstream; both with Retry-After"""
+    metrics.inc("limited_total", help_text="Requests turned away, per limit and status", limit=e.name, status=e.status)
+    return jsonify({"error": str(e)}), e.status, {"Retry-After": str(e.retry_after)}
+
+
+@api.after_app_request
 def after_request(response):
     response.headers.add('Access-Control-Allow-Origin', '*')
     response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
@@ -473,7 +1131,7 @@ def after_request(response):
 
 
 
-@app.route('/register', methods=['POST'])
+@api.route('/register', methods=['POST'])
 def register():
     data = request.get_json()
     email = data.get('email')
@@ -485,7 +1143,8 @@ def register():
     if users_collection.find_one({"email": email}):
         return jsonify({"message": "User already exists"}), 400
 
-    hashed_password = bcrypt.generate_password_hash(password).decode('utf-8')
+    with metrics.span("password_hash"):
+        hashed_password = password_hasher.hash(password)
     users_collection.insert_one({
         "email": email,
         "password": hashed_password,
@@ -494,7 +1153,19 @@ def register():
 
     return jsonify({"message": "User registered successfully"}), 201
 
-@app.route("/login", methods=["POST"])
+def rehash_password(user_id, old_hash, password):
+    """Store the password again at the configured cost, unless it changed meanwhile"""
+    try:
+        users_collection.update_one(
+            {"_id": user_id, "password": old_hash},
+            {"$set": {"password": password_hasher.hash(password)}}
+        )
+        metrics.inc("password_rehash_total", help_text="Passwords rehashed at login after a cost change")
+    except Exception as e:
+        print(f"Error rehashing password: {str(e)}")
+
+
+@api.route("/login", methods=["POST"])
 def login():
     try:
         data = request.json
@@ -508,23 +1179,30 @@ def login():
         if not user:
             return jsonify({"error": "User not found"}), 404
 
-        if not bcrypt.check_password_hash(user["password"], password):
+        with metrics.span("password_check"):
+            password_ok = password_hasher.check(user["password"], password)
+        if not password_ok:
             return jsonify({"error": "Invalid password"}), 401
 
+        if password_hasher.needs_rehash(user["password"]):
+            io_executor.submit(rehash_password, user["_id"], user["password"], password)
+
         access_token = create_access_token(identity=email)
         return jsonify({"access_token": access_token}), 200
 
+    except LimitExceeded:
+        raise
     except Exception as e:
         print("Error:", str(e))
         return jsonify({"error": "Internal Server Error", "message": str(e)}), 500
 
-@app.route('/logout', methods=['POST'])
+@api.route('/logout', methods=['POST'])
 @jwt_required()
 def logout():
     return jsonify({"message": "Logged out successfully"}), 200
 
 
-@app.route('/store_message', methods=['POST'])
+@api.route('/store_message', methods=['POST'])
 @jwt_required()
 def store_message():
     data = request.get_json()
@@ -536,71 +1214,152 @@ def store_message():
         return jsonify({"message": "Invalid data"}), 400
     
     # Get active conference for user
-    active_conference = conferences_collection.find_one({
-        'user_email': user_email,
-        'is_active': True
-    })
+    conference_id = ownership_cache.active_conference_id(user_email)
     
-    if not active_conference:
+    if not conference_id:
         # Create a default conference if none exists
         conference = {
             'user_email': user_email,
             'topic': 'General Conversation',
             'created_at': datetime.now(timezone.utc),
             'updated_at': datetime.now(timezone.utc),
-            'is_active': True
+            'is_active': True,
+            'message_count': 0
         }
         result = conferences_collection.insert_one(conference)
         conference_id = str(result.inserted_id)
-    else:
-        conference_id = str(active_conference['_id'])
+        ownership_cache.set_active(user_email, conference_id)
     
-    result = messages_collection.insert_one({
+    message_id = messages_collection.insert_one({
         "email": user_email,
         "conference_id": conference_id,
         "content": message,
         "role": role,
         "timestamp": datetime.now(timezone.utc)
-    })
+    }).inserted_id
     
-    # Update conference updated_at
-    conferences_collection.update_one(
-        {'_id': ObjectId(conference_id)},
-        {'$set': {'updated_at': datetime.now(timezone.utc)}}
-    )
+    # Update conference updated_at and message count
+    count_conference_messages(conference_id, 1, touched_at=datetime.now(timezone.utc))
     
     return jsonify({
         "message": "Message stored successfully",
-        "message_id": str(result.inserted_id),
+        "message_id": str(message_id),
         "conference_id": conference_id
     }), 201
 
-@app.route('/get_chat_history/<conference_id>', methods=['GET'])
+def rehydrate_if_archived(user_email, conference_id):
+    """Restore an archived conference's messages; only called after ownership_cache.owns()"""
+    if ownership_cache.is_archived(user_email, conference_id):
+        with metrics.span("archive_rehydrate"):
+            conversation_archive.rehydrate(conference_id)
+        ownership_cache.set_rehydrated(user_email, conference_id)
+
+
+def rehydrate_if_archived_since_cached(user_email, conference_id):
+    """Re-check the archived flag in Mongo and restore the conference if it is set.
+
+    The archive job runs in another process, so an ownership entry cached
+    before it ran still says "not archived". Called only when a lookup came up
+    empty; returns True if messages were restored and the lookup should be
+    repeated.
+    """
+    conference = conferences_collection.find_one({'_id': ObjectId(conference_id)}, {'archived': 1})
+    if not conference or not conference.get('archived'):
+        return False
+    with metrics.span("archive_rehydrate"):
+        conversation_archive.rehydrate(conference_id)
+    ownership_cache.set_rehydrated(user_email, conference_id)
+    return True
+
+
+@api.route('/get_chat_history/<conference_id>', methods=['GET'])
 @jwt_required()
 def get_chat_history(conference_id):
     user_email = get_jwt_identity()
     
     # Verify conference belongs to user
-    conference = conferences_collection.find_one({
-        '_id': ObjectId(conference_id),
-        'user_email': user_email
-    })
-    
-    if not conference:
+    if not ownership_cache.owns(user_email, conference_id):
         return jsonify({'error': 'Conference not found'}), 404
-    
-    # Get chat history for this conference
-    history = list(messages_collection.find(
-        {"email": user_email, "conference_id": conference_id},
-        {"_id": 1, "content": 1, "role": 1, "timestamp": 1} 
-    ).sort("timestamp", 1))
 
-    for message in history:
-        message["_id"] = str(message["_id"])
+    # Archived conversations are moved back to the messages collection on first read
+    rehydrate_if_archived(user_email, conference_id)
     
-    return jsonify(history), 200
+    query = {"email": user_email, "conference_id": conference_id}
+    projection = {"_id": 1, "content": 1, "role": 1, "timestamp": 1}
+    limit = request.args.get("limit")
+
+    if limit is None:
+        # Whole conversation, oldest first, streamed straight from the cursor
+        def history_cursor():
+            return messages_collection.find(query, projection).sort(
+                [("timestamp", 1), ("_id", 1)]
+            ).batch_size(HISTORY_BATCH_SIZE)
+
+        cursor = history_cursor()
+        first = next(cursor, None)
+        if first is None and rehydrate_if_archived_since_cached(user_email, conference_id):
+            cursor = history_cursor()
+            first = next(cursor, None)
+        documents = itertools.chain([first], cursor) if first is not None else ()
+        return Response(stream_json_array(documents), mimetype="application/json"), 200
+
+    try:
+        limit = int(limit)
+    except ValueError:
+        limit = 0
+    if limit < 1:
+        return jsonify({'error': 'limit must be a positive integer'}), 400
+
+    # One page, newest messages first; ?before=<cursor> pages further back
+    before = request.args.get("before")
+    if before:
+        try:
+            before_timestamp, before_id = decode_history_cursor(before)
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        query["$or"] = [
+            {"timestamp": {"$lt": before_timestamp}},
+            {"timestamp": before_timestamp, "_id": {"$lt": before_id}}
+        ]
+
+    limit = min(limit, MAX_HISTORY_PAGE_SIZE)
+
+    def read_page():
+        return list(messages_collection.find(query, projection).sort(
+            [("timestamp", -1), ("_id", -1)]
+        ).limit(limit + 1))
+
+    page = read_page()
+    if not page and not before and rehydrate_if_archived_since_cached(user_email, conference_id):
+        page = read_page()
+
+    headers = {}
+    if len(page) > limit:
+        page = page[:limit]
+        headers["X-Next-Cursor"] = encode_history_cursor(page[-1])
+
+    # Pages are returned in chronological order like the full history
+    page.reverse()
+    return Response(dump_json(page), mimetype="application/json", headers=headers), 200
+
+@api.route('/export', methods=['GET'])
+@jwt_required()
+def export_conversations():
+    """Download all of the user's conversations as NDJSON (?compression=zstd to compress)"""
+    user_email = get_jwt_identity()
+    compression = request.args.get("compression") or None
+    if compression not in (None, "zstd"):
+        return jsonify({'error': 'Unsupported compression'}), 400
+
+    compress = compression == "zstd"
+    filename = "conversations.ndjson.zst" if compress else "conversations.ndjson"
+    return Response(
+        stream_with_context(user_export.iter_chunks(user_email, compress=compress)),
+        mimetype="application/zstd" if compress else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
 
-@app.route('/delete_message', methods=['DELETE'])
+@api.route('/delete_message', methods=['DELETE'])
 @jwt_required()
 def delete_message():
     try:
@@ -617,14 +1376,11 @@ def delete_message():
             return jsonify({"error": "Invalid ID format"}), 400
 
         # Verify conference belongs to user
-        conference = conferences_collection.find_one({
-            '_id': ObjectId(conference_id),
-            'user_email': user_email
-        })
-        
-        if not conference:
+        if not ownership_cache.owns(user_email, conference_id):
             return jsonify({"error": "Conference not found"}), 404
 
+        rehydrate_if_archived(user_email, conference_id)
+
         # Try to delete the message
         result = messages_collection.delete_one({
             "_id": ObjectId(message_id),
@@ -640,9 +1396,18 @@ def delete_message():
             })
             if message_exists:
                 return jsonify({"error": "Unauthorized to delete this message"}), 403
-            else:
+            if not rehydrate_if_archived_since_cached(user_email, conference_id):
+                return jsonify({"error": "Message not found"}), 404
+            result = messages_collection.delete_one({
+                "_id": ObjectId(message_id),
+                "email": user_email,
+                "conference_id": conference_id
+            })
+            if result.deleted_count == 0:
                 return jsonify({"error": "Message not found"}), 404
 
+        count_conference_messages(conference_id, -1)
+
         return jsonify({
             "message": "Message deleted successfully",
             "message_id": message_id
@@ -652,16 +1417,68 @@ def delete_message():
         print(f"Error deleting message: {str(e)}")
         return jsonify({"error": f"An error occurred: {str(e)}"}), 500
 
-@app.route('/health_check', methods=['GET'])
+@api.route('/health_check', methods=['GET'])
 def health_check():
     return jsonify({
         "status": "healthy",
         "message": "API is running"
     }), 200
 
+@api.route('/upstream_stats', methods=['GET'])
+def get_upstream_stats():
+    return jsonify(upstream_stats()), 200
+
+@api.route('/semantic_cache_stats', methods=['GET'])
+def get_semantic_cache_stats():
+    semantic_cache = get_semantic_cache()
+    if semantic_cache is None:
+        return jsonify({"enabled": False}), 200
+    return jsonify({"enabled": True, **semantic_cache.stats()}), 200
+
+def optional_stats(get_component):
+    """Stats source for a component that may be turned off"""
+    def source():
+        component = get_component()
+        return component.stats() if component is not None else {}
+    return source
+
+
+metrics.add_stats("upstream", upstream_stats, label="upstream")
+metrics.add_stats("nutrition_cache", lambda: nutrition_cache.stats())
+metrics.add_stats("mongo_pool", lambda: mongo_pool.stats())
+metrics.add_stats("semantic_cache", optional_stats(get_semantic_cache))
+metrics.add_stats("write_behind", optional_stats(get_write_behind))
+metrics.add_stats("rate_limit", optional_stats(get_rate_limiter))
+metrics.add_stats("password_hasher", lambda: password_hasher.stats())
+metrics.add_stats("upstream_concurrency", lambda: upstream_limits.stats(), label="upstream")
+
+
+@api.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+@api.route('/mongo_pool_stats', methods=['GET'])
+def get_mongo_pool_stats():
+    return jsonify(mongo_pool.stats()), 200
+
+@api.route('/limits_stats', methods=['GET'])
+def get_limits_stats():
+    rate_limiter = get_rate_limiter()
+    return jsonify({
+        "rate_limit": {"enabled": False} if rate_limiter is None else {"enabled": True, **rate_limiter.stats()},
+        "upstream_concurrency": upstream_limits.stats()
+    }), 200
+
+@api.route('/write_behind_stats', methods=['GET'])
+def get_write_behind_stats():
+    write_behind = get_write_behind()
+    if write_behind is None:
+        return jsonify({"enabled": False}), 200
+    return jsonify({"enabled": True, **write_behind.stats()}), 200
+
 
 
-@app.route('/create_conference', methods=['POST'])
+@api.route('/create_conference', methods=['POST'])
 @jwt_required()
 def create_conference():
     user_email = get_jwt_identity()
@@ -673,7 +1490,8 @@ def create_conference():
         'topic': topic,
         'created_at': datetime.now(timezone.utc),
         'updated_at': datetime.now(timezone.utc),
-        'is_active': True
+        'is_active': True,
+        'message_count': 0
     }
     
     result = conferences_collection.insert_one(conference)
@@ -684,47 +1502,90 @@ def create_conference():
         {'user_email': user_email, '_id': {'$ne': result.inserted_id}},
         {'$set': {'is_active': False}}
     )
+    ownership_cache.set_active(user_email, conference_id)
     
     return jsonify({
         'message': 'Conference created successfully',
         'conference_id': conference_id
     }), 201
 
-@app.route('/get_conferences', methods=['GET'])
+@api.route('/get_conferences', methods=['GET'])
 @jwt_required()
 def get_conferences():
     user_email = get_jwt_identity()
     
     conferences = list(conferences_collection.find(
         {'user_email': user_email},
-        {'_id': 1, 'topic': 1, 'created_at': 1, 'updated_at': 1, 'is_active': 1}
+        {'_id': 1, 'topic': 1, 'created_at': 1, 'updated_at': 1, 'is_active': 1, 'message_count': 1}
     ).sort('updated_at', -1))
     
     for conf in conferences:
         conf['_id'] = str(conf['_id'])
-        conf['message_count'] = messages_collection.count_documents({
-            'conference_id': conf['_id']
-        })
+
+    # Conferences created before message_count was tracked are counted in one query
+    uncounted = [conf for conf in conferences if 'message_count' not in conf]
+    if uncounted:
+        counts = count_messages_by_conference([conf['_id'] for conf in uncounted])
+        for conf in uncounted:
+            conf['message_count'] = counts.get(conf['_id'], 0)
     
     return jsonify(conferences), 200
 
 
+def count_messages_by_conference(conference_ids):
+    """Count messages for many conferences with a single aggregation"""
+    pipeline = [
+        {'$match': {'conference_id': {'$in': conference_ids}}},
+        {'$group': {'_id': '$conference_id', 'count': {'$sum': 1}}}
+    ]
+    return {row['_id']: row['count'] for row in messages_collection.aggregate(pipeline)}
+
+
+@api.cli.command("backfill-message-counts")
+def backfill_message_counts():
+    """Recompute message_count on every conference from the messages collection.
+
+    Archived conferences also count the messages held in message_archives.
+    Run once after deploying denormalized counts, or to repair drifted counts.
+    Counts written concurrently with the backfill may be off by the in-flight
+    messages, so run it while traffic is low.
+    """
+    counts = {
+        row['_id']: row['count']
+        for row in messages_collection.aggregate([
+            {'$group': {'_id': '$conference_id', 'count': {'$sum': 1}}}
+        ])
+    }
+    for archive in message_archives.find({}, {'message_count': 1}):
+        counts[archive['_id']] = counts.get(archive['_id'], 0) + archive.get('message_count', 0)
+
+    updates = []
+    updated = 0
+    for conf in conferences_collection.find({}, {'_id': 1}):
+        updates.append(UpdateOne(
+            {'_id': conf['_id']},
+            {'$set': {'message_count': counts.get(str(conf['_id']), 0)}}
+        ))
+        if len(updates) >= 1000:
+            updated += conferences_collection.bulk_write(updates, ordered=False).matched_count
+            updates = []
+    if updates:
+        updated += conferences_collection.bulk_write(updates, ordered=False).matched_count
+
+    click.echo(f"Updated message_count on {updated} conferences")
+
+
 
 
 
-@app.route('/switch_conference/<conference_id>', methods=['POST'])
+@api.route('/switch_conference/<conference_id>', methods=['POST'])
 @jwt_required()
 def switch_conference(conference_id):
     try:
         user_email = get_jwt_identity()
         
         # Validate conference belongs to user
-        conference = conferences_collection.find_one({
-            '_id': ObjectId(conference_id),
-            'user_email': user_email
-        })
-        
-        if not conference:
+        if not ownership_cache.owns(user_email, conference_id):
             return jsonify({'error': 'Conference not found'}), 404
         
         # Set all conferences as inactive
@@ -738,6 +1599,7 @@ def switch_conference(conference_id):
             {'_id': ObjectId(conference_id)},
             {'$set': {'is_active': True, 'updated_at': datetime.now(timezone.utc)}}
         )
+        ownership_cache.set_active(user_email, conference_id)
         
         return jsonify({'message': 'Conference switched successfully'}), 200
     except Exception as e:
@@ -745,5 +1607,110 @@ def switch_conference(conference_id):
         return jsonify({'error': str(e)}), 500
 
 
+@api.cli.command("export-user")
+@click.argument("email")
+@click.option("--output", "-o", type=click.File("wb"), default="-", help="File to write (default: stdout)")
+@click.option("--zstd", "compress", is_flag=True, help="Compress the output with zstd")
+def export_user_command(email, output, compress):
+    """Export a user's conferences, messages and feedback as NDJSON"""
+    for chunk in user_export.iter_chunks(email, compress=compress):
+        output.write(chunk)
+
+
+@api.cli.command("archive-conversations")
+@click.option("--idle-days", type=int, default=90, show_default=True,
+              help="Archive inactive conferences not updated for this many days")
+@click.option("--batch-size", type=int, default=50, show_default=True, help="Conferences per batch")
+@click.option("--dry-run", is_flag=True, help="Measure what would be archived without changing anything")
+def archive_conversations_command(idle_days, batch_size, dry_run):
+    """Move the messages of idle conferences into compressed archives"""
+    cutoff = datetime.now(timezone.utc) - timedelta(days=idle_days)
+    totals = {"conferences": 0, "messages": 0, "raw_bytes": 0, "compressed_bytes": 0, "skipped": 0}
+    for number, report in enumerate(conversation_archive.archive_idle(cutoff, batch_size, dry_run), 1):
+        for key in totals:
+            totals[key] += report[key]
+        click.echo(
+            f"batch {number}: {report['conferences']} conferences, {report['messages']} messages, "
+            f"{report['raw_bytes']} -> {report['compressed_bytes']} bytes "
+            f"({report['bytes_reclaimed']} reclaimed) in {report['seconds'] * 1000:.0f} ms"
+        )
+    reclaimed = totals["raw_bytes"] - totals["compressed_bytes"]
+    click.echo(
+        f"{'Would archive' if dry_run else 'Archived'} {totals['conferences']} conferences "
+        f"({totals['messages']} messages): {reclaimed} bytes reclaimed, "
+        f"{totals['skipped']} skipped as too large"
+    )
+
+
+@api.cli.command("ensure-indexes")
+def ensure_indexes_command():
+    """Create the indexes every collection needs (safe to run repeatedly)"""
+    failures = ensure_indexes(get_db())
+    for collection_name, index_name, error in failures:
+        click.echo(f"Could not create index {index_name} on {collection_name}: {error}", err=True)
+    if failures:
+        raise SystemExit(1)
+    click.echo("Indexes are up to date")
+
+
+@api.cli.command("check-query-plans")
+def check_query_plans_command():
+    """Fail if any hot query is answered with a collection scan"""
+    collection_scans = 0
+    for name, stages, uses_collection_scan in check_query_plans(get_db()):
+        status = "COLLSCAN" if uses_collection_scan else "ok"
+        click.echo(f"{name}: {status} ({' > '.join(stages)})")
+        collection_scans += uses_collection_scan
+    if collection_scans:
+        raise SystemExit(1)
+
+
+def create_app(config=None):
+    """Build the Flask app.
+
+    Loads .env, reads the per-request settings into app.config (``config``
+    overrides them) and registers the routes. Database, Gemini and HTTP
+    clients are created on first use, not here.
+    """
+    load_dotenv()
+
+    app = Flask(__name__)
+    app.config.update(
+        JWT_SECRET_KEY=os.getenv('JWT_SECRET_KEY', 'default-secret-key'),
+        FATSECRET_CLIENT_ID=os.getenv("CLIENT_ID"),
+        FATSECRET_CLIENT_SECRET=os.getenv("CLIENT_SECRET"),
+        FATSECRET_TOKEN_URL=os.getenv("FATSECRET_TOKEN_URL", "https://oauth.fatsecret.com/connect/token"),
+        FATSECRET_API_URL=os.getenv("FATSECRET_API_URL", "https://platform.fatsecret.com/rest/server.api"),
+        # ElevenLabs voice API configuration
+        ELEVENLABS_API_KEY=os.getenv("ELEVENLABS_API_KEY", "sk_0e6a4b11b085079f89561266e6270d9816fb0c5e66a25570"),
+        ELEVENLABS_API_URL=os.getenv("ELEVENLABS_API_URL", "https://api.elevenlabs.io/v1"),
+        DEFAULT_VOICE_ID=os.getenv("DEFAULT_VOICE_ID", "SLVLJ4RCTvobsWx1j1Ds"),  # Default voice ID
+        # When enabled, new clips are synthesized while the client downloads them
+        AUDIO_STREAMING=os.getenv("AUDIO_STREAMING", "true").lower() == "true",
+        SERVER_TIMING_ENABLED=os.getenv("SERVER_TIMING_ENABLED", "false").lower() == "true"
+    )
+    if config:
+        app.config.update(config)
+
+    CORS(app, expose_headers=["X-Next-Cursor", "Server-Timing", "Retry-After"])
+    jwt.init_app(app)
+    app.register_blueprint(api)
+
+    # Cross-worker invalidation through a Mongo change stream (requires a replica set)
+    if os.getenv("OWNERSHIP_CACHE_CHANGE_STREAM", "false").lower() == "true":
+        ownership_cache.watch_changes()
+
+    # Optionally create missing indexes when the app starts (also: flask ensure-indexes)
+    if os.getenv("ENSURE_INDEXES_ON_STARTUP", "false").lower() == "true":
+        for collection_name, index_name, error in ensure_indexes(get_db()):
+            print(f"Could not create index {index_name} on {collection_name}: {error}")
+
+    return app
+
+
+# gunicorn app:app and flask run use this instance
+app = create_app()
+
+
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
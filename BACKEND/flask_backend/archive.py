@@ -0,0 +1,200 @@
+import io
+import time
+from datetime import datetime, timezone
+
+import bson
+from bson import Binary
+from pymongo.errors import BulkWriteError
+
+DUPLICATE_KEY = 11000
+# Archive documents must stay under MongoDB's 16 MiB document limit
+MAX_BLOB_BYTES = 15 * 1024 * 1024
+
+
+class ArchiveTooLarge(Exception):
+    pass
+
+
+class ConversationArchive:
+    """Cold storage for the messages of idle conferences.
+
+    ``archive_idle`` packs each inactive conference's messages into one zstd
+    blob of concatenated BSON documents in the ``message_archives`` collection
+    (keyed by conference id), marks the conference ``archived`` (recording
+    ``message_count`` if it has none yet) and removes the messages from the
+    hot collection. ``rehydrate`` puts them back the first
+    time the conversation is read again and stamps ``rehydrated_at``, so the
+    conversation is not archived again until it has been idle past the cutoff
+    once more.
+
+    Every step is safe to repeat: the archive is written before the flag and
+    the deletes, and restores skip messages that are already present, so an
+    interrupted run leaves data in one place or both, never in neither.
+    """
+
+    def __init__(self, conferences, messages, archives, level=10, batch_size=1000):
+        self.conferences = conferences
+        self.messages = messages
+        self.archives = archives
+        self.level = level
+        self.batch_size = batch_size
+
+    def _pack(self, conference_id):
+        """Compress the conference's hot messages; returns (blob, message ids, raw BSON bytes)"""
+        import zstandard
+
+        compressor = zstandard.ZstdCompressor(level=self.level).compressobj()
+        pieces = []
+        compressed_size = 0
+        message_ids = []
+        raw_bytes = 0
+        cursor = self.messages.find({"conference_id": conference_id}).sort(
+            [("timestamp", 1), ("_id", 1)]
+        ).batch_size(self.batch_size)
+        for message in cursor:
+            encoded = bson.encode(message)
+            raw_bytes += len(encoded)
+            message_ids.append(message["_id"])
+            piece = compressor.compress(encoded)
+            if piece:
+                pieces.append(piece)
+                compressed_size += len(piece)
+                if compressed_size > MAX_BLOB_BYTES:
+                    raise ArchiveTooLarge(conference_id)
+        pieces.append(compressor.flush())
+        blob = b"".join(pieces)
+        if len(blob) > MAX_BLOB_BYTES:
+            raise ArchiveTooLarge(conference_id)
+        return blob, message_ids, raw_bytes
+
+    def archive_conference(self, conference):
+        """Archive one conference's messages; returns a summary dict"""
+        conference_id = str(conference["_id"])
+        existing = self.archives.find_one({"_id": conference_id}, {"_id": 1})
+        if existing:
+            # A previous run stopped half way, or new messages arrived: fold them back in first
+            self.rehydrate(conference_id)
+
+        blob, message_ids, raw_bytes = self._pack(conference_id)
+        if message_ids:
+            self.archives.replace_one(
+                {"_id": conference_id},
+                {
+                    "_id": conference_id,
+                    "user_email": conference.get("user_email"),
+                    "message_count": len(message_ids),
+                    "raw_bytes": raw_bytes,
+                    "compressed_bytes": len(blob),
+                    "archived_at": datetime.now(timezone.utc),
+                    "blob": Binary(blob)
+                },
+                upsert=True
+            )
+        # Legacy conferences are counted from the hot messages, which are about to go
+        self.conferences.update_one(
+            {"_id": conference["_id"]},
+            [{"$set": {
+                "archived": True,
+                "archived_at": datetime.now(timezone.utc),
+                "message_count": {"$ifNull": ["$message_count", len(message_ids)]}
+            }}]
+        )
+        for start in range(0, len(message_ids), self.batch_size):
+            self.messages.delete_many({"_id": {"$in": message_ids[start:start + self.batch_size]}})
+
+        return {
+            "messages": len(message_ids),
+            "raw_bytes": raw_bytes,
+            "compressed_bytes": len(blob) if message_ids else 0
+        }
+
+    def iter_idle_conferences(self, cutoff, batch_size):
+        """Yield lists of inactive, unarchived conferences last updated before cutoff"""
+        last_id = None
+        while True:
+            query = {
+                "is_active": False,
+                "updated_at": {"$lt": cutoff},
+                "archived": {"$ne": True},
+                # Opened again since it was last archived
+                "$or": [{"rehydrated_at": {"$exists": False}}, {"rehydrated_at": {"$lt": cutoff}}]
+            }
+            if last_id is not None:
+                query["_id"] = {"$gt": last_id}
+            batch = list(self.conferences.find(query, {"_id": 1, "user_email": 1}).sort("_id", 1).limit(batch_size))
+            if not batch:
+                return
+            yield batch
+            last_id = batch[-1]["_id"]
+
+    def archive_idle(self, cutoff, batch_size=50, dry_run=False):
+        """Archive idle conferences batch by batch, yielding a report per batch"""
+        for batch in self.iter_idle_conferences(cutoff, batch_size):
+            started = time.perf_counter()
+            report = {"conferences": 0, "messages": 0, "raw_bytes": 0, "compressed_bytes": 0, "skipped": 0}
+            for conference in batch:
+                try:
+                    if dry_run:
+                        blob, message_ids, raw_bytes = self._pack(str(conference["_id"]))
+                        summary = {
+                            "messages": len(message_ids),
+                            "raw_bytes": raw_bytes,
+                            "compressed_bytes": len(blob) if message_ids else 0
+                        }
+                    else:
+                        summary = self.archive_conference(conference)
+                except ArchiveTooLarge:
+                    report["skipped"] += 1
+                    continue
+                report["conferences"] += 1
+                for key in ("messages", "raw_bytes", "compressed_bytes"):
+                    report[key] += summary[key]
+            report["bytes_reclaimed"] = report["raw_bytes"] - report["compressed_bytes"]
+            report["seconds"] = time.perf_counter() - started
+            yield report
+
+    def iter_archived_messages(self, conference_id):
+        """Decode the archived messages of a conference without restoring them"""
+        archive = self.archives.find_one({"_id": conference_id}, {"blob": 1})
+        if not archive or not archive.get("blob"):
+            return
+        import zstandard
+
+        reader = zstandard.ZstdDecompressor().stream_reader(io.BytesIO(archive["blob"]))
+        yield from bson.decode_file_iter(reader)
+
+    def rehydrate(self, conference_id):
+        """Move an archived conference's messages back to the hot collection.
+
+        Returns the number of messages restored; 0 (after a single _id lookup)
+        when the conference is not archived.
+        """
+        if not self.archives.find_one({"_id": conference_id}, {"_id": 1}):
+            return 0
+
+        restored = 0
+        batch = []
+        for message in self.iter_archived_messages(conference_id):
+            batch.append(message)
+            if len(batch) >= self.batch_size:
+                restored += self._restore(batch)
+                batch = []
+        if batch:
+            restored += self._restore(batch)
+
+        self.conferences.update_one(
+            {"_id": bson.ObjectId(conference_id)},
+            {"$unset": {"archived": "", "archived_at": ""}, "$set": {"rehydrated_at": datetime.now(timezone.utc)}}
+        )
+        self.archives.delete_one({"_id": conference_id})
+        return restored
+
+    def _restore(self, messages):
+        try:
+            return len(self.messages.insert_many(messages, ordered=False).inserted_ids)
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if any(error.get("code") != DUPLICATE_KEY for error in errors):
+                raise
+            # Already restored by an earlier, interrupted attempt
+            return len(messages) - len(errors)
@@ -0,0 +1,238 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+
+AUDIO_FILENAME_RE = re.compile(r"^[0-9a-f]{64}\.mp3$")
+
+
+class AudioCache:
+    """Disk-backed cache of synthesized speech, keyed by what was synthesized.
+
+    Clips are stored as ``<sha256>.mp3`` so identical requests reuse the same
+    file. When the directory grows past ``max_bytes`` the least recently used
+    clips (by modification time, refreshed on every hit) are deleted until it
+    is back under ``low_water`` of the budget, so the directory is rescanned
+    only once in a while rather than on every write.
+
+    A clip can also be registered as pending: its synthesis request is kept in
+    a ``<sha256>.json`` sidecar so the clip can be synthesized and streamed
+    when it is first fetched, and teed into the cache at the same time. The
+    fetch that synthesizes it claims the sidecar by renaming it to
+    ``<sha256>.synth``, so concurrent fetches (in any worker) wait for that
+    one synthesis instead of starting their own.
+    """
+
+    # Pending requests nobody fetched within this many seconds are discarded
+    pending_ttl = 3600
+    # A claim older than this is assumed abandoned (its worker died) and can be taken over
+    claim_ttl = 300
+    # Eviction frees space down to this fraction of max_bytes
+    low_water = 0.9
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._size = self._scan_size()
+
+    @staticmethod
+    def key_for(voice_id, text, voice_settings):
+        payload = json.dumps([voice_id, text, voice_settings], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def filename_for(key):
+        return f"{key}.mp3"
+
+    def path_for(self, filename):
+        """Return the on-disk path for a cache filename, or None if it is not one"""
+        if not AUDIO_FILENAME_RE.match(filename):
+            return None
+        return os.path.join(self.directory, filename)
+
+    def get(self, key):
+        """Return the path of a cached clip and mark it as recently used"""
+        path = self.path_for(self.filename_for(key))
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def add_pending(self, key, request_data):
+        """Remember how to synthesize a clip that has not been generated yet"""
+        path = os.path.join(self.directory, f"{key}.json")
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".part")
+        with os.fdopen(fd, "w") as f:
+            json.dump(request_data, f)
+        os.replace(tmp_path, path)
+
+    def get_pending(self, key):
+        try:
+            with open(os.path.join(self.directory, f"{key}.json"), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def claim_pending(self, key):
+        """Take the pending request for key so only the caller synthesizes it.
+
+        Returns the request data, or None if the clip is not pending or another
+        fetch is already synthesizing it.
+        """
+        pending_path = os.path.join(self.directory, f"{key}.json")
+        claim_path = os.path.join(self.directory, f"{key}.synth")
+        try:
+            os.replace(pending_path, claim_path)
+            # The rename keeps the sidecar's age; the claim's age starts now
+            os.utime(claim_path)
+        except FileNotFoundError:
+            try:
+                if os.stat(claim_path).st_mtime >= time.time() - self.claim_ttl:
+                    return None
+                os.utime(claim_path)
+            except OSError:
+                return None
+        try:
+            with open(claim_path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def release_claim(self, key):
+        """Put a claimed request back as pending, e.g. after the synthesis failed"""
+        try:
+            os.replace(os.path.join(self.directory, f"{key}.synth"), os.path.join(self.directory, f"{key}.json"))
+        except OSError:
+            pass
+
+    def is_pending(self, key):
+        """True while the clip is waiting to be synthesized or being synthesized"""
+        return any(
+            os.path.exists(os.path.join(self.directory, f"{key}{suffix}")) for suffix in (".json", ".synth")
+        )
+
+    def wait_for(self, key, timeout, poll_interval=0.1):
+        """Wait for another fetch to finish the clip; returns its path, or None"""
+        deadline = time.monotonic() + timeout
+        while True:
+            path = self.get(key)
+            if path or not self.is_pending(key):
+                return path
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(poll_interval)
+
+    def _remove_pending(self, key):
+        for suffix in (".json", ".synth"):
+            try:
+                os.unlink(os.path.join(self.directory, f"{key}{suffix}"))
+            except OSError:
+                pass
+
+    def tee(self, key, chunks):
+        """Yield audio chunks while writing them into the cache.
+
+        The clip only becomes visible once the whole stream has been written,
+        so an interrupted stream never leaves a truncated file behind; its
+        claim is put back as pending so a later fetch can retry.
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".part")
+        size = 0
+        completed = False
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in chunks:
+                    if not chunk:
+                        continue
+                    f.write(chunk)
+                    size += len(chunk)
+                    yield chunk
+            completed = size > 0
+        finally:
+            if completed:
+                path = self.path_for(self.filename_for(key))
+                replaced = self._file_size(path)
+                os.replace(tmp_path, path)
+                self._remove_pending(key)
+                self._account(size - replaced)
+            else:
+                if os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
+                self.release_claim(key)
+
+    def put(self, key, data):
+        """Store a clip atomically and evict old clips if over budget"""
+        path = self.path_for(self.filename_for(key))
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            replaced = self._file_size(path)
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+        self._account(len(data) - replaced)
+        return path
+
+    @staticmethod
+    def _file_size(path):
+        try:
+            return os.stat(path).st_size
+        except OSError:
+            return 0
+
+    def _account(self, added):
+        """Track bytes added (an overwrite adds only the difference) and evict if over budget"""
+        with self._lock:
+            self._size += added
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _scan(self):
+        entries = []
+        stale_before = time.time() - self.pending_ttl
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith((".json", ".synth", ".part")):
+                # Drop abandoned pending requests and partial writes
+                try:
+                    if entry.stat().st_mtime < stale_before:
+                        os.unlink(entry.path)
+                except OSError:
+                    pass
+            elif AUDIO_FILENAME_RE.match(entry.name):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _scan_size(self):
+        return sum(size for _, size, _ in self._scan())
+
+    def _evict(self):
+        # Rescan so clips written by other workers are accounted for
+        entries = sorted(self._scan())
+        total = sum(size for _, size, _ in entries)
+        if total <= self.max_bytes:
+            self._size = total
+            return
+        target = self.max_bytes * self.low_water
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.unlink(path)
+                total -= size
+            except OSError:
+                continue
+        self._size = total
@@ -0,0 +1,103 @@
+"""Load app.py with benchmark stand-ins and seed the benchmark users.
+
+Used by bench.run for the in-process server and by bench.wsgi in every
+gunicorn worker. Seeding is deterministic (fixed ids, one shared password
+hash) and idempotent, so workers that each hold their own mongomock database,
+or share one real MongoDB, all see the same users and conferences.
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+
+from bench.stubs import FakeGenerativeModel
+
+BENCH_PASSWORD = "bench-password"
+
+
+def bench_email(index):
+    return f"bench{index}@example.com"
+
+
+def bench_conference_id(index):
+    return str(ObjectId(f"{index + 1:024x}"))
+
+
+def configure_environment(upstream_environment, mongo_uri=None, scratch=None):
+    """Environment app.py reads: stub upstream URLs, scratch caches and the database"""
+    scratch = scratch or tempfile.mkdtemp(prefix="vision_forage_bench_")
+    os.environ.update(upstream_environment)
+    os.environ.setdefault("JWT_SECRET_KEY", "bench-secret-key-with-enough-length-for-hs256")
+    os.environ.setdefault("FATSECRET_TOKEN_CACHE", os.path.join(scratch, "fatsecret_token.json"))
+    os.environ.setdefault("AUDIO_CACHE_DIR", os.path.join(scratch, "audio"))
+    os.environ.setdefault("PASSWORD_HASH_LOCK_DIR", os.path.join(scratch, "password_slots"))
+    if mongo_uri:
+        os.environ["MONGO_URL"] = mongo_uri
+
+
+def load_backend(mongo_uri=None, gemini_first_chunk_ms=300.0, gemini_chunk_ms=20.0):
+    """Import app.py and swap in mongomock (unless mongo_uri) and the fake Gemini model"""
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import app as backend
+
+    if not mongo_uri:
+        try:
+            import mongomock
+        except ImportError:
+            raise SystemExit("Install mongomock or pass --mongo-uri to run the benchmark")
+        backend.mongo_pool.use_client(mongomock.MongoClient())
+
+    backend.model = FakeGenerativeModel(
+        first_chunk_delay=gemini_first_chunk_ms / 1000,
+        chunk_delay=gemini_chunk_ms / 1000
+    )
+    return backend
+
+
+def seed_users(backend, count, history_size):
+    """Create the benchmark users, one conference each with history_size messages"""
+    from passwords import _hash_password
+
+    password_hash = _hash_password(BENCH_PASSWORD, int(os.getenv("BCRYPT_LOG_ROUNDS", "12")))
+    start = datetime.now(timezone.utc) - timedelta(days=1)
+    for index in range(count):
+        email = bench_email(index)
+        conference_id = bench_conference_id(index)
+        backend.users_collection.update_one(
+            {"email": email},
+            {"$setOnInsert": {"password": password_hash, "created_at": start}},
+            upsert=True
+        )
+        backend.conferences_collection.update_one(
+            {"_id": ObjectId(conference_id)},
+            {"$setOnInsert": {
+                "user_email": email,
+                "topic": "Benchmark",
+                "created_at": start,
+                "updated_at": start,
+                "is_active": True,
+                "message_count": history_size
+            }},
+            upsert=True
+        )
+        if not history_size:
+            continue
+        # Seed a realistic history so paging and counting have work to do
+        try:
+            backend.messages_collection.insert_many([
+                {
+                    "_id": ObjectId(f"{index + 1:08x}{position:016x}"),
+                    "email": email,
+                    "conference_id": conference_id,
+                    "content": f"seed message {position}",
+                    "role": "user" if position % 2 == 0 else "bot",
+                    "timestamp": start + timedelta(seconds=position)
+                }
+                for position in range(history_size)
+            ], ordered=False)
+        except BulkWriteError:
+            # Already seeded by another worker sharing the database
+            pass
@@ -0,0 +1,89 @@
+"""Fail when importing app.py gets slow or pulls in heavy dependencies.
+
+Runs ``python -X importtime -c "import app"`` in fresh interpreters, takes the
+median cumulative import time of ``app`` and compares it with a budget. It also
+fails if modules that should only load on first use (the Gemini SDK, gRPC,
+model runtimes) were imported::
+
+    python -m bench.import_budget --budget-ms 800
+
+Run it from BACKEND/flask_backend.
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+# Loaded lazily by the clients that need them, never by importing the app
+DEFAULT_FORBIDDEN = ("google.generativeai", "grpc", "sentence_transformers", "torch", "numpy")
+
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)$")
+
+
+def measure(module, cwd):
+    """Import module once in a fresh interpreter; returns ({module: cumulative us}, max RSS in KiB)"""
+    script = (
+        f"import resource, sys; import {module}; "
+        "sys.stderr.write('maxrss %d\\n' % resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)"
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", script],
+        cwd=cwd, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise SystemExit(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+
+    cumulative = {}
+    max_rss = None
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            cumulative[match.group(4)] = int(match.group(2))
+        elif line.startswith("maxrss "):
+            max_rss = int(line.split()[1])
+    return cumulative, max_rss
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="app")
+    parser.add_argument("--budget-ms", type=float, default=800.0, help="median cumulative import time allowed")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="slowest top-level imports to list")
+    parser.add_argument("--forbid", action="append", help="module that must not be imported (repeatable)")
+    args = parser.parse_args(argv)
+
+    cwd = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    forbidden = tuple(args.forbid or DEFAULT_FORBIDDEN)
+
+    runs = [measure(args.module, cwd) for _ in range(args.runs)]
+    timings = [cumulative.get(args.module, 0) / 1000 for cumulative, _ in runs]
+    median_ms = statistics.median(timings)
+    last_imports, max_rss = runs[-1]
+
+    print(f"import {args.module}: median {median_ms:.0f} ms over {args.runs} runs (budget {args.budget_ms:.0f} ms)")
+    if max_rss is not None:
+        print(f"max RSS after import: {max_rss / 1024:.1f} MiB")
+    print("slowest imports:")
+    top_level = {name: us for name, us in last_imports.items() if "." not in name and name != args.module}
+    for name, us in sorted(top_level.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"  {us / 1000:8.1f} ms  {name}")
+
+    failed = False
+    loaded = sorted(name for name in last_imports
+                    if any(name == module or name.startswith(module + ".") for module in forbidden))
+    if loaded:
+        print(f"FAIL: imported at startup: {', '.join(loaded[:10])}")
+        failed = True
+    if median_ms > args.budget_ms:
+        print(f"FAIL: import time {median_ms:.0f} ms is over the {args.budget_ms:.0f} ms budget")
+        failed = True
+    if failed:
+        raise SystemExit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
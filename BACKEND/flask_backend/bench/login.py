@@ -0,0 +1,85 @@
+"""Login throughput against the size of the password hashing pool.
+
+Runs bench.run under gunicorn (several workers, the repo's gunicorn.conf.py)
+once per host-wide pool size (PASSWORD_HASH_HOST_SLOTS: bcrypt hashes allowed
+at once across all workers) with a login-heavy mix, and prints login
+throughput and latency next to chat latency, showing how much a login burst
+slows chats down::
+
+    python -m bench.login --pool-sizes 1,2,4 --gunicorn-workers 4 --duration 20
+
+--pool-workers sets the processes each gunicorn worker may use
+(PASSWORD_HASH_WORKERS; 0 hashes on the request threads). Rejected logins
+(503 when the hashing queue is full or no slot frees up) count as errors.
+Run it from BACKEND/flask_backend.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+
+def run_once(args, pool_size, output):
+    env = dict(
+        os.environ,
+        PASSWORD_HASH_HOST_SLOTS=str(pool_size),
+        PASSWORD_HASH_WORKERS=str(args.pool_workers),
+        BCRYPT_LOG_ROUNDS=str(args.rounds)
+    )
+    if args.max_pending is not None:
+        env["PASSWORD_HASH_MAX_PENDING"] = str(args.max_pending)
+    command = [
+        sys.executable, "-m", "bench.run",
+        "--mix", args.mix,
+        "--concurrency", str(args.concurrency),
+        "--duration", str(args.duration),
+        "--warmup", str(args.warmup),
+        "--users", str(args.users),
+        "--history-size", "10",
+        "--gunicorn-workers", str(args.gunicorn_workers),
+        "--output", output
+    ]
+    cwd = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    subprocess.run(command, cwd=cwd, env=env, check=True, stdout=subprocess.DEVNULL)
+    with open(output) as f:
+        return json.load(f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pool-sizes", default="1,2,4", help="comma-separated PASSWORD_HASH_HOST_SLOTS values")
+    parser.add_argument("--pool-workers", type=int, default=1, help="PASSWORD_HASH_WORKERS per gunicorn worker")
+    parser.add_argument("--gunicorn-workers", type=int, default=4,
+                        help="gunicorn workers (0 serves in-process from one werkzeug server)")
+    parser.add_argument("--rounds", type=int, default=12, help="BCRYPT_LOG_ROUNDS")
+    parser.add_argument("--max-pending", type=int, help="PASSWORD_HASH_MAX_PENDING (default: the app's)")
+    parser.add_argument("--mix", default="login=3,chat=1")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--warmup", type=float, default=3.0)
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--output", default="bench-login.json", help="JSON results file")
+    args = parser.parse_args(argv)
+
+    results = {}
+    scratch = tempfile.mkdtemp(prefix="vision_forage_login_bench_")
+    for pool_size in (int(size) for size in args.pool_sizes.split(",")):
+        results[pool_size] = run_once(args, pool_size, os.path.join(scratch, f"pool-{pool_size}.json"))
+
+    print(f"{args.gunicorn_workers} gunicorn workers, {os.cpu_count()} cores, bcrypt cost {args.rounds}")
+    print(f"{'pool':>5}{'logins/s':>10}{'login errs':>12}{'login p50':>11}{'login p95':>11}{'chat p95':>10}")
+    for pool_size, result in results.items():
+        login = result["routes"].get("login", {})
+        chat = result["routes"].get("chat", {})
+        print(f"{pool_size:>5}{login.get('rps', 0):>10.1f}{login.get('errors', 0):>12}"
+              f"{login.get('p50_ms', 0):>11.1f}{login.get('p95_ms', 0):>11.1f}{chat.get('p95_ms', 0):>10.1f}")
+
+    with open(args.output, "w") as f:
+        json.dump({str(size): result for size, result in results.items()}, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,373 @@
+"""Offline load test for the Flask backend.
+
+Runs app.py against local stand-ins (mongomock or a local MongoDB, a fake
+streaming Gemini model and a stub HTTP server for FatSecret and ElevenLabs),
+drives a weighted mix of requests at fixed concurrency and writes per-route
+latency percentiles and throughput to a JSON file::
+
+    python -m bench.run --concurrency 16 --duration 30 --output bench-results.json
+    python -m bench.run --baseline bench-results.json --output bench-new.json
+    python -m bench.run --gunicorn-workers 4 --mix login=3,chat=1
+
+With --gunicorn-workers the app runs under gunicorn with the repo's config;
+each worker then has its own mongomock database seeded with the same users.
+Run it from BACKEND/flask_backend. mongomock is needed unless --mongo-uri is given.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+import requests
+
+from bench.backend import (
+    BENCH_PASSWORD, bench_conference_id, bench_email, configure_environment, load_backend, seed_users
+)
+from bench.stubs import FOODS, UpstreamStub
+
+DEFAULT_MIX = "chat=3,chat_voice=1,history=3,conferences=2,autocomplete=2"
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in OPERATIONS:
+            raise SystemExit(f"Unknown operation in --mix: {name}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(fraction * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class BenchUser:
+    def __init__(self, base_url, email, token, conference_id):
+        self.base_url = base_url
+        self.email = email
+        self.conference_id = conference_id
+        self.session = requests.Session()
+        self.session.headers["Authorization"] = f"Bearer {token}"
+
+    def call(self, method, path, **kwargs):
+        return self.session.request(method, self.base_url + path, timeout=60, **kwargs)
+
+
+def op_chat(user):
+    response = user.call("POST", "/gemini_chat", json={
+        "message": "I have been feeling stressed about work lately",
+        "conference_id": user.conference_id,
+        "outputMode": "text"
+    })
+    return [("chat", response.elapsed_total, response.ok)]
+
+
+def op_chat_voice(user):
+    response = user.call("POST", "/gemini_chat", json={
+        "message": "Can you tell me something calming?",
+        "conference_id": user.conference_id,
+        "outputMode": "voice"
+    })
+    samples = [("chat_voice", response.elapsed_total, response.ok)]
+    audio_url = response.ok and response.json().get("audioUrl")
+    if audio_url:
+        audio = user.call("GET", audio_url)
+        samples.append(("audio", audio.elapsed_total, audio.ok))
+    return samples
+
+
+def op_history(user):
+    response = user.call("GET", f"/get_chat_history/{user.conference_id}", params={"limit": 50})
+    return [("history", response.elapsed_total, response.ok)]
+
+
+def op_conferences(user):
+    response = user.call("GET", "/get_conferences")
+    return [("conferences", response.elapsed_total, response.ok)]
+
+
+def op_login(user):
+    # Logging in is unauthenticated, so this bypasses the user's session
+    started = time.perf_counter()
+    response = requests.post(
+        user.base_url + "/login", json={"email": user.email, "password": BENCH_PASSWORD}, timeout=60
+    )
+    return [("login", time.perf_counter() - started, response.ok)]
+
+
+def op_autocomplete(user):
+    # One keystroke burst: a request per prefix as the user types
+    food = random.choice(FOODS)
+    samples = []
+    for length in range(2, min(len(food), 6) + 1):
+        response = user.call("GET", "/api/nutrition/autocomplete", params={"query": food[:length]})
+        samples.append(("autocomplete", response.elapsed_total, response.ok))
+    return samples
+
+
+OPERATIONS = {
+    "chat": op_chat,
+    "chat_voice": op_chat_voice,
+    "history": op_history,
+    "conferences": op_conferences,
+    "autocomplete": op_autocomplete,
+    "login": op_login,
+}
+
+
+def _timed_request(session_request):
+    """Wrap Session.request so each response carries wall time including the body"""
+    def request(*args, **kwargs):
+        started = time.perf_counter()
+        response = session_request(*args, **kwargs)
+        response.content
+        response.elapsed_total = time.perf_counter() - started
+        return response
+    return request
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def serve_in_process(args, upstream):
+    """Serve the app from a threaded werkzeug server in this process; returns (base_url, stop)"""
+    from werkzeug.serving import make_server
+
+    configure_environment(upstream.environment(), args.mongo_uri)
+    backend = load_backend(args.mongo_uri, args.gemini_first_chunk_ms, args.gemini_chunk_ms)
+    seed_users(backend, args.users, args.history_size)
+
+    # Per-request access logs would dominate the output and the timings
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    server = make_server("127.0.0.1", 0, backend.app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="bench-app", daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}", server.shutdown
+
+
+def serve_gunicorn(args, upstream):
+    """Serve bench.wsgi from gunicorn with the repo's gunicorn.conf.py; returns (base_url, stop)"""
+    port = free_port()
+    env = dict(
+        os.environ,
+        **upstream.environment(),
+        GUNICORN_WORKERS=str(args.gunicorn_workers),
+        GUNICORN_BIND=f"127.0.0.1:{port}",
+        BENCH_SCRATCH=tempfile.mkdtemp(prefix="vision_forage_bench_"),
+        BENCH_USERS=str(args.users),
+        BENCH_HISTORY_SIZE=str(args.history_size),
+        BENCH_GEMINI_FIRST_CHUNK_MS=str(args.gemini_first_chunk_ms),
+        BENCH_GEMINI_CHUNK_MS=str(args.gemini_chunk_ms)
+    )
+    if args.mongo_uri:
+        env["BENCH_MONGO_URI"] = args.mongo_uri
+    cwd = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "--log-level", "warning", "bench.wsgi:app"],
+        cwd=cwd, env=env
+    )
+
+    def stop():
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 120
+    while True:
+        if process.poll() is not None:
+            raise SystemExit("gunicorn exited before serving requests")
+        try:
+            if requests.get(f"{base_url}/health_check", timeout=5).ok:
+                break
+        except requests.RequestException:
+            pass
+        if time.monotonic() > deadline:
+            stop()
+            raise SystemExit("gunicorn did not start serving within 120s")
+        time.sleep(0.5)
+    return base_url, stop
+
+
+def login_users(base_url, count):
+    """Log the seeded users in; with several workers every login may land on a different one"""
+    users = []
+    for index in range(count):
+        email = bench_email(index)
+        response = requests.post(
+            f"{base_url}/login", json={"email": email, "password": BENCH_PASSWORD}, timeout=60
+        )
+        response.raise_for_status()
+        user = BenchUser(base_url, email, response.json()["access_token"], bench_conference_id(index))
+        user.session.request = _timed_request(user.session.request)
+        users.append(user)
+    return users
+
+
+def run_workload(users, mix, concurrency, duration, warmup):
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    samples = []
+    samples_lock = threading.Lock()
+    started = time.perf_counter()
+    measure_from = started + warmup
+    deadline = measure_from + duration
+
+    def worker(worker_index):
+        user = users[worker_index % len(users)]
+        local = []
+        while time.perf_counter() < deadline:
+            operation = OPERATIONS[random.choices(names, weights)[0]]
+            try:
+                results = operation(user)
+            except requests.RequestException as e:
+                results = [(operation.__name__[3:], 0.0, False)]
+                print(f"Request failed: {str(e)}")
+            if time.perf_counter() >= measure_from:
+                local.extend(results)
+        with samples_lock:
+            samples.extend(local)
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - measure_from
+    return samples, elapsed
+
+
+def summarize(samples, elapsed):
+    by_route = {}
+    for route, latency, ok in samples:
+        by_route.setdefault(route, []).append((latency, ok))
+
+    def describe(entries):
+        latencies = sorted(latency for latency, ok in entries if ok)
+        return {
+            "requests": len(entries),
+            "errors": sum(1 for _, ok in entries if not ok),
+            "rps": round(len(entries) / elapsed, 2),
+            "p50_ms": round(1000 * percentile(latencies, 0.50), 2),
+            "p95_ms": round(1000 * percentile(latencies, 0.95), 2),
+            "p99_ms": round(1000 * percentile(latencies, 0.99), 2),
+            "mean_ms": round(1000 * sum(latencies) / len(latencies), 2) if latencies else 0.0,
+            "max_ms": round(1000 * latencies[-1], 2) if latencies else 0.0
+        }
+
+    routes = {route: describe(entries) for route, entries in sorted(by_route.items())}
+    total = describe([(latency, ok) for _, latency, ok in samples])
+    return routes, total
+
+
+def print_report(routes, total, baseline=None):
+    header = f"{'route':<14}{'reqs':>8}{'errs':>6}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    if baseline:
+        header += f"{'p95 vs base':>13}{'rps vs base':>13}"
+    print(header)
+    for route, row in list(routes.items()) + [("TOTAL", total)]:
+        line = (f"{route:<14}{row['requests']:>8}{row['errors']:>6}{row['rps']:>9.1f}"
+                f"{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}")
+        base = (baseline.get("routes", {}).get(route) if route != "TOTAL" else baseline.get("total")) if baseline else None
+        if base:
+            p95_change = (row["p95_ms"] / base["p95_ms"] - 1) * 100 if base["p95_ms"] else 0.0
+            rps_change = (row["rps"] / base["rps"] - 1) * 100 if base["rps"] else 0.0
+            line += f"{p95_change:>+12.1f}%{rps_change:>+12.1f}%"
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent simulated clients")
+    parser.add_argument("--duration", type=float, default=30.0, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=3.0, help="seconds run before measuring")
+    parser.add_argument("--users", type=int, default=8, help="distinct users (each with one conference)")
+    parser.add_argument("--history-size", type=int, default=500, help="seeded messages per conference")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="weighted operations, e.g. chat=3,history=1")
+    parser.add_argument("--gemini-first-chunk-ms", type=float, default=300.0)
+    parser.add_argument("--gemini-chunk-ms", type=float, default=20.0)
+    parser.add_argument("--upstream-latency-ms", type=float, default=50.0,
+                        help="delay of the FatSecret/ElevenLabs stand-ins")
+    parser.add_argument("--mongo-uri", help="use this MongoDB instead of mongomock")
+    parser.add_argument("--gunicorn-workers", type=int, default=0,
+                        help="serve from gunicorn (gunicorn.conf.py) with this many workers instead of in-process")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default="bench-results.json", help="JSON results file")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    args = parser.parse_args(argv)
+
+    random.seed(args.seed)
+    mix = parse_mix(args.mix)
+
+    upstream = UpstreamStub(latency=args.upstream_latency_ms / 1000).start()
+    if args.gunicorn_workers:
+        base_url, stop = serve_gunicorn(args, upstream)
+    else:
+        base_url, stop = serve_in_process(args, upstream)
+    try:
+        users = login_users(base_url, args.users)
+        samples, elapsed = run_workload(users, mix, args.concurrency, args.duration, args.warmup)
+    finally:
+        stop()
+        upstream.stop()
+
+    routes, total = summarize(samples, elapsed)
+    results = {
+        "commit": git_commit(),
+        "finished_at": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "warmup": args.warmup,
+            "users": args.users,
+            "history_size": args.history_size,
+            "mix": mix,
+            "gemini_first_chunk_ms": args.gemini_first_chunk_ms,
+            "gemini_chunk_ms": args.gemini_chunk_ms,
+            "upstream_latency_ms": args.upstream_latency_ms,
+            "mongo": "mongodb" if args.mongo_uri else "mongomock",
+            "gunicorn_workers": args.gunicorn_workers
+        },
+        "elapsed_seconds": round(elapsed, 3),
+        "routes": routes,
+        "total": total
+    }
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_report(routes, total, baseline)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
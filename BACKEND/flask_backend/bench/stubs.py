@@ -0,0 +1,133 @@
+import itertools
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+FOODS = [
+    "apple", "apple juice", "apricot", "avocado", "banana", "banana bread", "bagel", "broccoli",
+    "brown rice", "carrot", "cheddar cheese", "chicken breast", "chickpeas", "oatmeal", "orange",
+    "peanut butter", "salmon", "spinach", "strawberry", "sweet potato", "tofu", "yogurt",
+]
+
+
+class _Chunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeGenerativeModel:
+    """Stand-in for genai.GenerativeModel that streams a canned reply.
+
+    ``first_chunk_delay`` imitates Gemini's time to first token and
+    ``chunk_delay`` the gap between chunks.
+    """
+
+    def __init__(self, words=120, words_per_chunk=8, first_chunk_delay=0.3, chunk_delay=0.02):
+        self.words = words
+        self.words_per_chunk = words_per_chunk
+        self.first_chunk_delay = first_chunk_delay
+        self.chunk_delay = chunk_delay
+        self._replies = itertools.count()
+
+    def _chunks(self):
+        # Every reply differs so caches keyed on the text (audio clips) still miss
+        words = [f"reply{next(self._replies)}"] + [f"word{i}" for i in range(1, self.words)]
+        time.sleep(self.first_chunk_delay)
+        for start in range(0, len(words), self.words_per_chunk):
+            if start:
+                time.sleep(self.chunk_delay)
+            yield _Chunk(" ".join(words[start:start + self.words_per_chunk]) + " ")
+
+    def generate_content(self, prompt, stream=False):
+        if stream:
+            return self._chunks()
+        return _Chunk("".join(chunk.text for chunk in self._chunks()))
+
+
+class _UpstreamHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type="application/json"):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path != "/rest/server.api":
+            return self._send(404, {"error": "not found"})
+        time.sleep(self.server.latency)
+        params = {name: values[0] for name, values in parse_qs(url.query).items()}
+        method = params.get("method")
+        if method == "foods.autocomplete":
+            prefix = params.get("expression", "").lower()
+            matches = [food for food in FOODS if food.startswith(prefix)][:4]
+            return self._send(200, {"suggestions": {"suggestion": matches} if matches else None})
+        if method == "foods.search":
+            query = params.get("search_expression", "").lower()
+            foods = [
+                {"food_id": str(index), "food_name": food, "food_description": "Per 100g - Calories: 52kcal"}
+                for index, food in enumerate(FOODS) if query in food
+            ]
+            return self._send(200, {"foods": {"food": foods}})
+        if method == "food.get":
+            return self._send(200, {"food": {"food_id": params.get("food_id"), "servings": {}}})
+        return self._send(200, {"error": {"code": 3, "message": "Unknown method"}})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        self._read_body()
+        if url.path == "/connect/token":
+            return self._send(200, {"access_token": "bench-token", "expires_in": 86400, "token_type": "Bearer"})
+
+        match = re.fullmatch(r"/v1/text-to-speech/[^/]+(/stream)?", url.path)
+        if not match:
+            return self._send(404, {"error": "not found"})
+        time.sleep(self.server.latency)
+        # Roughly three seconds of 128 kbit/s audio
+        return self._send(200, b"\xff\xfb" * 24000, content_type="audio/mpeg")
+
+
+class UpstreamStub:
+    """Local HTTP server imitating the FatSecret and ElevenLabs endpoints the app uses"""
+
+    def __init__(self, latency=0.05, host="127.0.0.1", port=0):
+        self.server = ThreadingHTTPServer((host, port), _UpstreamHandler)
+        self.server.daemon_threads = True
+        self.server.latency = latency
+        self._thread = threading.Thread(target=self.server.serve_forever, name="upstream-stub", daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def environment(self):
+        """Environment variables pointing the app at this server"""
+        return {
+            "FATSECRET_TOKEN_URL": f"{self.base_url}/connect/token",
+            "FATSECRET_API_URL": f"{self.base_url}/rest/server.api",
+            "ELEVENLABS_API_URL": f"{self.base_url}/v1",
+        }
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,19 @@
+"""gunicorn entry point for benchmarks: the app with stand-ins, seeded per worker.
+
+bench.run starts ``gunicorn -c gunicorn.conf.py bench.wsgi:app`` when given
+--gunicorn-workers and passes its settings in BENCH_* variables. Every worker
+imports this module (the config does not preload), so each one loads its own
+stand-ins and seeds the same users.
+"""
+import os
+
+from bench.backend import configure_environment, load_backend, seed_users
+
+configure_environment({}, mongo_uri=os.getenv("BENCH_MONGO_URI"), scratch=os.environ["BENCH_SCRATCH"])
+backend = load_backend(
+    mongo_uri=os.getenv("BENCH_MONGO_URI"),
+    gemini_first_chunk_ms=float(os.environ["BENCH_GEMINI_FIRST_CHUNK_MS"]),
+    gemini_chunk_ms=float(os.environ["BENCH_GEMINI_CHUNK_MS"])
+)
+seed_users(backend, int(os.environ["BENCH_USERS"]), int(os.environ["BENCH_HISTORY_SIZE"]))
+app = backend.app
@@ -0,0 +1,108 @@
+from datetime import datetime, timezone
+
+import orjson
+from bson import ObjectId
+
+EXPORT_VERSION = 1
+# Bytes of NDJSON gathered before a chunk is yielded (and compressed)
+CHUNK_SIZE = 64 * 1024
+
+
+def _default(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, bytes):
+        return value.hex()
+    raise TypeError
+
+
+def encode_record(record_type, document):
+    """One NDJSON line: the document with a leading "type" field"""
+    # Mongo returns naive datetimes that are in UTC
+    return orjson.dumps(
+        {"type": record_type, **document},
+        default=_default,
+        option=orjson.OPT_NAIVE_UTC | orjson.OPT_APPEND_NEWLINE
+    )
+
+
+class UserExport:
+    """Everything stored for one user, as a stream of NDJSON records.
+
+    The first line describes the export. Each conference is followed by its
+    messages (oldest first) and then its feedback. Conferences are read in
+    keyset pages and each conference's records from a batched cursor, so
+    memory use does not grow with the size of the history. Messages of
+    archived conferences are read from ``archive`` (a ConversationArchive)
+    without restoring them.
+    """
+
+    def __init__(self, conferences, messages, feedback, batch_size=1000, archive=None):
+        self.conferences = conferences
+        self.messages = messages
+        self.feedback = feedback
+        self.batch_size = batch_size
+        self.archive = archive
+
+    def iter_conferences(self, user_email):
+        last_id = None
+        while True:
+            query = {"user_email": user_email}
+            if last_id is not None:
+                query["_id"] = {"$gt": last_id}
+            page = list(self.conferences.find(query).sort("_id", 1).limit(self.batch_size))
+            yield from page
+            if len(page) < self.batch_size:
+                return
+            last_id = page[-1]["_id"]
+
+    def iter_messages(self, user_email, conference):
+        conference_id = str(conference["_id"])
+        if self.archive is not None and conference.get("archived"):
+            # Archived messages predate anything written since
+            for message in self.archive.iter_archived_messages(conference_id):
+                if message.get("email") == user_email:
+                    yield message
+        yield from self.messages.find(
+            {"email": user_email, "conference_id": conference_id}
+        ).sort([("timestamp", 1), ("_id", 1)]).batch_size(self.batch_size)
+
+    def iter_feedback(self, conference):
+        return self.feedback.find(
+            {"conference_id": str(conference["_id"])}
+        ).sort("timestamp", 1).batch_size(self.batch_size)
+
+    def iter_records(self, user_email):
+        yield encode_record("export", {
+            "version": EXPORT_VERSION,
+            "user_email": user_email,
+            "exported_at": datetime.now(timezone.utc)
+        })
+        for conference in self.iter_conferences(user_email):
+            yield encode_record("conference", conference)
+            for message in self.iter_messages(user_email, conference):
+                yield encode_record("message", message)
+            for feedback in self.iter_feedback(conference):
+                yield encode_record("feedback", feedback)
+
+    def iter_chunks(self, user_email, compress=False, level=3):
+        """Yield the export in chunks of about CHUNK_SIZE bytes, zstd-compressed if asked"""
+        compressor = None
+        if compress:
+            import zstandard
+
+            compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+        buffer = bytearray()
+        for line in self.iter_records(user_email):
+            buffer += line
+            if len(buffer) >= CHUNK_SIZE:
+                chunk = compressor.compress(bytes(buffer)) if compressor else bytes(buffer)
+                buffer.clear()
+                if chunk:
+                    yield chunk
+
+        if compressor:
+            yield compressor.compress(bytes(buffer)) + compressor.flush()
+        elif buffer:
+            yield bytes(buffer)
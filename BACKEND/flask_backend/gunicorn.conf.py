@@ -0,0 +1,29 @@
+# Gunicorn settings for the Flask backend: gunicorn app:app (or "app:create_app()")
+#
+# GUNICORN_WORKER_CLASS picks the serving profile:
+#   sync    - one request per worker process
+#   gthread - a thread pool per worker (default), no extra dependencies
+#   gevent  - cooperative workers; every blocking Mongo/HTTP call yields, so
+#             one process can hold many concurrent chats and SSE streams
+import multiprocessing
+import os
+
+bind = os.getenv("GUNICORN_BIND", f"0.0.0.0:{os.getenv('PORT', '8000')}")
+workers = int(os.getenv("GUNICORN_WORKERS", str(multiprocessing.cpu_count() * 2 + 1)))
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+
+if worker_class == "gevent":
+    try:
+        import gevent  # noqa: F401
+    except ImportError:
+        print("gevent is not installed, falling back to the gthread worker")
+        worker_class = "gthread"
+
+# Used by the gthread worker
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+# Used by the gevent worker
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "1000"))
+
+# Chat turns stream for a while, so allow for slow generations
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
@@ -0,0 +1,138 @@
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+# Methods that are safe to send again after a failure
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+# Statuses worth retrying for idempotent calls
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Statuses that mean a billed call was rejected before any work was done
+BILLED_RETRY_STATUSES = {429, 503}
+
+
+def _failed_to_connect(error):
+    """True when the request never reached the upstream (refused, DNS failure, connect timeout)"""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    if not isinstance(error, requests.ConnectionError):
+        return False
+    reason = error.args[0] if error.args else None
+    if isinstance(reason, MaxRetryError):
+        reason = reason.reason
+    # NameResolutionError is a NewConnectionError too
+    return isinstance(reason, NewConnectionError)
+
+
+class UpstreamClient:
+    """HTTP client for one upstream service.
+
+    Keeps a keep-alive connection pool per host, applies connect/read timeouts
+    to every call, retries idempotent calls with jittered exponential backoff
+    and records latency and error counts. Billed calls (``billed=True``) are
+    only retried when the upstream cannot have done the work: a failure to
+    connect, 429 or 503. A read timeout, a dropped connection or another 5xx
+    may already have been charged.
+    """
+
+    def __init__(self, name, pool_size=None, connect_timeout=None, read_timeout=None,
+                 max_retries=None, backoff_base=0.2, backoff_cap=2.0):
+        self.name = name
+        self.pool_size = pool_size or int(os.getenv("HTTP_POOL_SIZE", "10"))
+        self.connect_timeout = connect_timeout or float(os.getenv("HTTP_CONNECT_TIMEOUT", "3.05"))
+        self.read_timeout = read_timeout or float(os.getenv("HTTP_READ_TIMEOUT", "10"))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("HTTP_MAX_RETRIES", "2"))
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._stats_lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def _record(self, latency, failed):
+        with self._stats_lock:
+            self.requests += 1
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+            if failed:
+                self.errors += 1
+
+    def _backoff(self, attempt):
+        # Full jitter keeps retrying workers from hitting the upstream in lockstep
+        time.sleep(random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt))))
+
+    def request(self, method, url, idempotent=None, billed=False, timeout=None, **kwargs):
+        """Send a request, retrying idempotent calls on connection errors and 429/5xx"""
+        method = method.upper()
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        attempts = 1 + (self.max_retries if idempotent or billed else 0)
+        timeout = timeout or (self.connect_timeout, self.read_timeout)
+        retry_statuses = BILLED_RETRY_STATUSES if billed else RETRY_STATUSES
+
+        for attempt in range(attempts):
+            last_attempt = attempt == attempts - 1
+            started = time.perf_counter()
+            try:
+                response = self.session.request(method, url, timeout=timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self._record(time.perf_counter() - started, True)
+                if last_attempt or (billed and not _failed_to_connect(e)):
+                    raise
+            else:
+                failed = response.status_code >= 500 or response.status_code == 429
+                self._record(time.perf_counter() - started, failed)
+                if not (failed and response.status_code in retry_statuses) or last_attempt:
+                    return response
+                response.close()
+
+            with self._stats_lock:
+                self.retries += 1
+            self._backoff(attempt)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "retries": self.retries,
+                "avg_latency_ms": round(1000 * self.total_latency / self.requests, 2) if self.requests else 0.0,
+                "max_latency_ms": round(1000 * self.max_latency, 2)
+            }
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_upstream(name, **kwargs):
+    """Return the shared client for an upstream, creating it on first use"""
+    with _clients_lock:
+        client = _clients.get(name)
+        if client is None:
+            client = _clients[name] = UpstreamClient(name, **kwargs)
+        return client
+
+
+def upstream_stats():
+    with _clients_lock:
+        clients = list(_clients.values())
+    return {client.name: client.stats() for client in clients}
@@ -0,0 +1,98 @@
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+
+# Indexes the backend's queries rely on, per collection
+INDEXES = {
+    "users": [
+        {"keys": [("email", ASCENDING)], "unique": True},
+    ],
+    "conferences": [
+        {"keys": [("user_email", ASCENDING), ("is_active", ASCENDING)]},
+        {"keys": [("user_email", ASCENDING), ("updated_at", DESCENDING)]},
+        # Idle conference scan of flask archive-conversations
+        {"keys": [("is_active", ASCENDING), ("updated_at", ASCENDING)]},
+    ],
+    "messages": [
+        # Includes _id so keyset pages on (timestamp, _id) are read straight off the index
+        {"keys": [("email", ASCENDING), ("conference_id", ASCENDING), ("timestamp", ASCENDING), ("_id", ASCENDING)]},
+        {"keys": [("conference_id", ASCENDING), ("timestamp", ASCENDING)]},
+    ],
+    "feedback": [
+        {"keys": [("conference_id", ASCENDING), ("timestamp", DESCENDING)]},
+    ],
+    "voice_profiles": [
+        {"keys": [("email", ASCENDING)], "unique": True},
+    ],
+    "user_preferences": [
+        {"keys": [("email", ASCENDING)], "unique": True},
+    ],
+    # Shared rate limit windows (RATE_LIMIT_STORE=mongo) expire on their own
+    "rate_limits": [
+        {"keys": [("expires_at", ASCENDING)], "expireAfterSeconds": 0},
+    ],
+}
+
+# The queries on the request path, as (name, collection, filter, sort)
+HOT_QUERIES = [
+    ("login", "users", {"email": "user@example.com"}, None),
+    ("active conference", "conferences", {"user_email": "user@example.com", "is_active": True}, None),
+    ("conference list", "conferences", {"user_email": "user@example.com"}, [("updated_at", DESCENDING)]),
+    ("chat history", "messages",
+     {"email": "user@example.com", "conference_id": "000000000000000000000000"},
+     [("timestamp", ASCENDING), ("_id", ASCENDING)]),
+    ("chat history page", "messages",
+     {"email": "user@example.com", "conference_id": "000000000000000000000000"},
+     [("timestamp", DESCENDING), ("_id", DESCENDING)]),
+    ("conference messages", "messages",
+     {"conference_id": "000000000000000000000000"}, [("timestamp", ASCENDING)]),
+    ("feedback", "feedback", {"conference_id": "000000000000000000000000"}, [("timestamp", DESCENDING)]),
+    ("voice profile", "voice_profiles", {"email": "user@example.com"}, None),
+    ("preferences", "user_preferences", {"email": "user@example.com"}, None),
+]
+
+
+def ensure_indexes(db):
+    """Create every declared index; existing identical indexes are left alone.
+
+    Returns a list of (collection, index name, error) for indexes that could not
+    be created, e.g. a unique index over duplicate data.
+    """
+    failures = []
+    for collection_name, specs in INDEXES.items():
+        collection = db[collection_name]
+        for spec in specs:
+            options = {key: value for key, value in spec.items() if key != "keys"}
+            try:
+                collection.create_index(spec["keys"], **options)
+            except OperationFailure as e:
+                name = "_".join(f"{field}_{direction}" for field, direction in spec["keys"])
+                failures.append((collection_name, name, str(e)))
+    return failures
+
+
+def _plan_stages(plan):
+    """Yield every stage name in an explain() plan tree"""
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for value in plan.values():
+            yield from _plan_stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from _plan_stages(item)
+
+
+def check_query_plans(db):
+    """Explain each hot query and report whether its winning plan scans the collection.
+
+    Returns a list of (query name, stages, uses_collection_scan).
+    """
+    results = []
+    for name, collection_name, query, sort in HOT_QUERIES:
+        cursor = db[collection_name].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        winning_plan = cursor.explain().get("queryPlanner", {}).get("winningPlan", {})
+        stages = list(_plan_stages(winning_plan))
+        results.append((name, stages, "COLLSCAN" in stages))
+    return results
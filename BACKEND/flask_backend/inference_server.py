@@ -0,0 +1,151 @@
+import queue
+import threading
+import time
+
+import torch
+
+
+class _GenerationRequest:
+    def __init__(self, input_ids):
+        self.input_ids = input_ids
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class BatchingGenerator:
+    """Serve a causal LM from one worker thread that batches concurrent prompts.
+
+    Callers block in ``generate`` while a background thread takes the first
+    queued prompt, waits up to ``max_wait_ms`` for more (up to
+    ``max_batch_size``), left-pads them into one batch and runs a single
+    ``model.generate`` call. The fixed ``prefix`` of every prompt is tokenized
+    once and reused, so it should end where the tokenizer always splits
+    (before whitespace, e.g. "User Input:" with the text starting " ...");
+    if it does not, whole prompts are tokenized instead. With
+    ``quantize=True`` the model's Linear layers are dynamically quantized to
+    int8, which speeds up CPU inference.
+    """
+
+    # Texts checked against the prefix to see whether its tokens can be reused
+    _seam_probes = (" hello", " I can't sleep", "\n", " ...", "ok")
+
+    def __init__(self, model, tokenizer, prefix="", max_batch_size=8, max_wait_ms=20,
+                 max_new_tokens=60, max_length=512, quantize=False):
+        if quantize:
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        self.model = model.eval()
+        self.tokenizer = tokenizer
+        self.pad_token_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_new_tokens = max_new_tokens
+        self.max_length = max_length
+        self.prefix = prefix
+        self.prefix_ids = tokenizer(prefix)["input_ids"] if prefix else []
+        self.reuse_prefix = self._prefix_splits_cleanly()
+
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.requests = 0
+        self.last_batch_size = 0
+        self.generated_tokens = 0
+        self.generation_seconds = 0.0
+
+        self._worker = threading.Thread(target=self._run, name="batching-generator", daemon=True)
+        self._worker.start()
+
+    def _prefix_splits_cleanly(self):
+        """True when prefix ids + text ids match the ids of the joined prompt"""
+        if not self.prefix:
+            return True
+        for probe in self._seam_probes:
+            joined = self.tokenizer(self.prefix + probe)["input_ids"]
+            body = self.tokenizer(probe, add_special_tokens=False)["input_ids"]
+            if joined != self.prefix_ids + body:
+                return False
+        return True
+
+    def generate(self, text, timeout=None):
+        """Generate a continuation of prefix + text and return only the new text"""
+        if self.reuse_prefix:
+            body_ids = self.tokenizer(text, add_special_tokens=False)["input_ids"]
+            budget = max(self.max_length - len(self.prefix_ids), 1)
+            input_ids = self.prefix_ids + body_ids[:budget]
+        else:
+            input_ids = self.tokenizer(self.prefix + text)["input_ids"][:self.max_length]
+        request = _GenerationRequest(input_ids)
+        self._queue.put(request)
+        if not request.event.wait(timeout):
+            raise TimeoutError("Generation did not finish in time")
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def _collect_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            try:
+                self._run_batch(batch)
+            except Exception as e:
+                for request in batch:
+                    request.error = e
+            finally:
+                for request in batch:
+                    request.event.set()
+
+    def _run_batch(self, batch):
+        width = max(len(request.input_ids) for request in batch)
+        input_ids = torch.full((len(batch), width), self.pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(batch), width), dtype=torch.long)
+        for row, request in enumerate(batch):
+            # Left padding keeps every prompt's last token in the same column
+            length = len(request.input_ids)
+            input_ids[row, width - length:] = torch.tensor(request.input_ids, dtype=torch.long)
+            attention_mask[row, width - length:] = 1
+
+        started = time.perf_counter()
+        with torch.inference_mode():
+            output = self.model.generate(
+                input_ids=input_ids,
+                attention_mask=attention_mask,
+                max_new_tokens=self.max_new_tokens,
+                pad_token_id=self.pad_token_id
+            )
+        elapsed = time.perf_counter() - started
+
+        new_tokens = output[:, width:]
+        for row, request in enumerate(batch):
+            request.result = self.tokenizer.decode(new_tokens[row], skip_special_tokens=True).strip()
+
+        with self._stats_lock:
+            self.batches += 1
+            self.requests += len(batch)
+            self.last_batch_size = len(batch)
+            self.generated_tokens += int((new_tokens != self.pad_token_id).sum())
+            self.generation_seconds += elapsed
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "batches": self.batches,
+                "requests": self.requests,
+                "last_batch_size": self.last_batch_size,
+                "avg_batch_size": self.requests / self.batches if self.batches else 0.0,
+                "tokens_per_second": self.generated_tokens / self.generation_seconds if self.generation_seconds else 0.0
+            }
@@ -0,0 +1,146 @@
+import hashlib
+import json
+import os
+import random
+import tempfile
+
+import numpy as np
+
+try:
+    import faiss
+except ImportError:  # numpy search is used instead
+    faiss = None
+
+DEFAULT_RESPONSE = "I'm not sure how to respond to that."
+
+
+def _model_name(embedding_model):
+    """Best-effort name of a sentence-transformers model (its class name otherwise)"""
+    card = getattr(embedding_model, "model_card_data", None)
+    name = getattr(card, "base_model", None)
+    if not name:
+        try:
+            name = embedding_model[0].auto_model.config.name_or_path
+        except (AttributeError, IndexError, KeyError, TypeError):
+            name = None
+    return name or type(embedding_model).__name__
+
+
+def _embedding_dimension(embedding_model):
+    get_dimension = getattr(embedding_model, "get_sentence_embedding_dimension", None)
+    dimension = get_dimension() if get_dimension else None
+    if dimension is None:
+        dimension = np.asarray(embedding_model.encode(["dimension probe"])).shape[-1]
+    return int(dimension)
+
+
+class IntentEngine:
+    """Nearest-intent classifier over the averaged embeddings of intents.json.
+
+    All patterns are encoded in one batch and averaged per intent. The result
+    is saved in ``cache_dir`` under a hash of the intents file, the embedding
+    model's name and its dimension, so later startups with the same file and
+    model load the vectors instead of re-encoding. Cached vectors of the wrong
+    dimension are rebuilt. Responses are looked up by tag in a dict.
+    """
+
+    def __init__(self, intents_path, embedding_model, cache_dir=None, max_distance=10.0, model_name=None):
+        with open(intents_path, "rb") as f:
+            raw = f.read()
+        intents = json.loads(raw.decode("utf-8"))["intents"]
+
+        self.embedding_model = embedding_model
+        self.model_name = model_name or _model_name(embedding_model)
+        self.dimension = _embedding_dimension(embedding_model)
+        key = hashlib.sha256(raw)
+        key.update(f"\0{self.model_name}\0{self.dimension}".encode("utf-8"))
+        self.cache_key = key.hexdigest()
+        self.cache_dir = cache_dir or os.path.dirname(os.path.abspath(intents_path))
+        # Squared L2 distance above which a match is not trusted
+        self.max_distance = max_distance
+        self.responses = {intent["tag"]: intent.get("responses", []) for intent in intents}
+
+        self.tags, vectors = self._load_or_build(intents)
+        self.index = self._build_index(vectors)
+
+    @property
+    def cache_path(self):
+        return os.path.join(self.cache_dir, f"intent_index-{self.cache_key[:16]}.npz")
+
+    def _load_or_build(self, intents):
+        try:
+            with np.load(self.cache_path, allow_pickle=False) as data:
+                tags, vectors = data["tags"].tolist(), data["vectors"]
+            if vectors.ndim == 2 and vectors.shape[1] == self.dimension:
+                return tags, vectors
+        except (OSError, KeyError, ValueError):
+            pass
+
+        # Intents without patterns have nothing to match against
+        intents = [intent for intent in intents if intent.get("patterns")]
+        tags = [intent["tag"] for intent in intents]
+        counts = np.array([len(intent["patterns"]) for intent in intents])
+        patterns = [pattern for intent in intents for pattern in intent["patterns"]]
+
+        embeddings = np.asarray(self.embedding_model.encode(patterns), dtype=np.float32)
+        offsets = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        vectors = (np.add.reduceat(embeddings, offsets, axis=0) / counts[:, np.newaxis]).astype(np.float32)
+
+        self._save(tags, vectors)
+        return tags, vectors
+
+    def _save(self, tags, vectors):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".npz")
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, tags=np.array(tags), vectors=vectors)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            print(f"Could not save intent index: {str(e)}")
+
+    @staticmethod
+    def _build_index(vectors):
+        if faiss is None:
+            return vectors
+        index = faiss.IndexFlatL2(vectors.shape[1])
+        index.add(vectors)
+        return index
+
+    def _search(self, embeddings):
+        """Return (distances, indices) of the nearest intent for each embedding"""
+        if faiss is not None:
+            distances, indices = self.index.search(embeddings, 1)
+            return distances[:, 0], indices[:, 0]
+        differences = embeddings[:, np.newaxis, :] - self.index[np.newaxis, :, :]
+        squared = np.einsum("ijk,ijk->ij", differences, differences)
+        indices = squared.argmin(axis=1)
+        return squared[np.arange(len(indices)), indices], indices
+
+    def classify_many(self, texts):
+        """Classify several messages with one encode call.
+
+        Returns a list of (tag, distance); tag is None when nothing is close enough.
+        """
+        if not texts:
+            return []
+        embeddings = np.asarray(self.embedding_model.encode(list(texts)), dtype=np.float32)
+        embeddings = embeddings.reshape(len(texts), -1)
+        distances, indices = self._search(embeddings)
+
+        results = []
+        for distance, index in zip(distances, indices):
+            if 0 <= index < len(self.tags) and distance <= self.max_distance:
+                results.append((self.tags[index], float(distance)))
+            else:
+                results.append((None, float(distance)))
+        return results
+
+    def classify(self, text):
+        return self.classify_many([text])[0]
+
+    def get_response(self, tag):
+        responses = self.responses.get(tag)
+        if not responses:
+            return DEFAULT_RESPONSE
+        return random.choice(responses)
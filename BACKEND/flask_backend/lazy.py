@@ -0,0 +1,52 @@
+import functools
+import threading
+
+_UNSET = object()
+
+
+def memoized(factory):
+    """Call a zero-argument factory once, on first use, and keep its result.
+
+    The result may be None (e.g. an optional feature that is turned off).
+    ``reset()`` on the returned function drops the value.
+    """
+    lock = threading.Lock()
+    value = _UNSET
+
+    @functools.wraps(factory)
+    def get():
+        nonlocal value
+        if value is _UNSET:
+            with lock:
+                if value is _UNSET:
+                    value = factory()
+        return value
+
+    def reset():
+        nonlocal value
+        with lock:
+            value = _UNSET
+
+    get.reset = reset
+    return get
+
+
+class LazyObject:
+    """Stand-in for an object that is only built when first used.
+
+    Attribute access is forwarded to ``factory()``'s result, which is created
+    once, so module-level clients and caches cost nothing at import time and
+    read their environment settings after the app factory has loaded them.
+    """
+
+    def __init__(self, factory):
+        object.__setattr__(self, "_resolve", memoized(factory))
+
+    def __getattr__(self, attribute):
+        return getattr(self._resolve(), attribute)
+
+    def __setattr__(self, attribute, value):
+        setattr(self._resolve(), attribute, value)
+
+    def __repr__(self):
+        return f"LazyObject({self._resolve.__name__})"
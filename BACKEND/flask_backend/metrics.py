@@ -0,0 +1,205 @@
+import bisect
+import contextvars
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; covers cache hits through slow model calls
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Stage timings of the current request, read back for the Server-Timing header
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in labels
+    )
+    return "{" + pairs + "}"
+
+
+def _format_value(value):
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+
+class MetricsRegistry:
+    """In-process counters and latency histograms rendered in Prometheus text format.
+
+    Each gunicorn worker keeps its own registry, so a scrape sees the worker
+    that answered it. Existing ``stats()`` dicts are exported through
+    ``add_stats`` instead of being counted twice.
+    """
+
+    def __init__(self, namespace="app", buckets=DEFAULT_BUCKETS):
+        self.namespace = namespace
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._help = {}
+        self._stats_sources = []
+
+    def _name(self, name):
+        return f"{self.namespace}_{name}"
+
+    def observe(self, name, value, help_text="", **labels):
+        key = (self._name(name), tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(self.buckets)
+                self._help.setdefault(key[0], help_text)
+            histogram.observe(value)
+
+    def inc(self, name, amount=1, help_text="", **labels):
+        key = (self._name(name), tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+            self._help.setdefault(key[0], help_text)
+
+    def add_stats(self, prefix, source, label=None):
+        """Export the numeric values of ``source()`` as gauges named prefix_<key>.
+
+        With ``label`` the source returns {label value: stats dict}, as
+        ``upstream_stats`` does.
+        """
+        self._stats_sources.append((prefix, source, label))
+
+    def record_stage(self, stage, seconds):
+        """Record how long one stage of a request took"""
+        self.observe("stage_duration_seconds", seconds, "Time spent in each request stage", stage=stage)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.append((stage, seconds))
+
+    @contextmanager
+    def span(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_stage(stage, time.perf_counter() - started)
+
+    def timed(self, stage):
+        """Decorator recording every call of a function as a stage"""
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.span(stage):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def timed_stream(self, chunks, first_stage, total_stage, started=None):
+        """Yield from chunks, recording time to the first chunk and to the end (or early stop).
+
+        Closing the wrapper closes chunks too, so stopping early also stops the source.
+        """
+        started = started or time.perf_counter()
+        first = True
+        try:
+            for chunk in chunks:
+                if first:
+                    self.record_stage(first_stage, time.perf_counter() - started)
+                    first = False
+                yield chunk
+        finally:
+            close = getattr(chunks, "close", None)
+            if close is not None:
+                close()
+            self.record_stage(total_stage, time.perf_counter() - started)
+
+    def _stats_gauges(self):
+        gauges = {}
+        for prefix, source, label in self._stats_sources:
+            try:
+                stats = source()
+            except Exception as e:
+                print(f"Could not collect {prefix} stats: {str(e)}")
+                continue
+            groups = stats.items() if label else [(None, stats)]
+            for label_value, values in groups:
+                labels = ((label, label_value),) if label else ()
+                for key, value in values.items():
+                    if isinstance(value, bool) or not isinstance(value, (int, float)):
+                        continue
+                    gauges.setdefault(self._name(f"{prefix}_{key}"), []).append((labels, value))
+        return gauges
+
+    def render(self):
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items(), key=lambda item: item[0])
+            help_texts = dict(self._help)
+            snapshots = [(key, list(h.counts), h.sum, h.count) for key, h in histograms]
+
+        declared = set()
+
+        def declare(name, metric_type):
+            if name in declared:
+                return
+            declared.add(name)
+            if help_texts.get(name):
+                lines.append(f"# HELP {name} {help_texts[name]}")
+            lines.append(f"# TYPE {name} {metric_type}")
+
+        for (name, labels), value in counters:
+            declare(name, "counter")
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+        for (name, labels), counts, total, count in snapshots:
+            declare(name, "histogram")
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = labels + (("le", repr(float(bound))),)
+                lines.append(f"{name}_bucket{_format_labels(le)} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+
+        for name, samples in sorted(self._stats_gauges().items()):
+            declare(name, "gauge")
+            for labels, value in samples:
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+        return "\n".join(lines) + "\n"
+
+
+def start_request_timings():
+    """Begin collecting stage timings for the current request and return the list they go in.
+
+    Work handed to other threads records into the same list when it runs
+    under ``contextvars.copy_context()``.
+    """
+    timings = []
+    _request_timings.set(timings)
+    return timings
+
+
+def server_timing_header(timings, total=None):
+    """Format stage timings as a Server-Timing header value (durations in ms)"""
+    entries = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings]
+    if total is not None:
+        entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
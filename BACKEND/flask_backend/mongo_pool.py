@@ -0,0 +1,185 @@
+import os
+import threading
+import weakref
+
+from pymongo import MongoClient, monitoring
+
+_pools = weakref.WeakSet()
+
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    """Connection pool counters fed by PyMongo's pool events"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.checkout_timeouts = 0
+        self.total_checkout_seconds = 0.0
+        self.max_checkout_seconds = 0.0
+        self.checked_out = 0
+        self.max_checked_out = 0
+        self.connections_created = 0
+        self.connections_closed = 0
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.checkouts += 1
+            duration = getattr(event, "duration", 0.0) or 0.0
+            self.total_checkout_seconds += duration
+            self.max_checkout_seconds = max(self.max_checkout_seconds, duration)
+            self.checked_out += 1
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.checkout_failures += 1
+            if event.reason == monitoring.ConnectionCheckOutFailedReason.TIMEOUT:
+                self.checkout_timeouts += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out = max(self.checked_out - 1, 0)
+
+    def connection_created(self, event):
+        with self._lock:
+            self.connections_created += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.connections_closed += 1
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+
+class MongoPool:
+    """One MongoClient per process, created on first use.
+
+    The client is never created at import time and is dropped in forked
+    children, so gunicorn workers started from a preloaded app each open their
+    own connections. It is meant to live for the whole process: do not close
+    it per request. Pool size and timeouts come from MONGO_MAX_POOL_SIZE,
+    MONGO_WAIT_QUEUE_TIMEOUT_MS and MONGO_SERVER_SELECTION_TIMEOUT_MS.
+    """
+
+    def __init__(self, uri=None, max_pool_size=None, wait_queue_timeout_ms=None,
+                 server_selection_timeout_ms=None, **client_options):
+        self.uri = uri
+        self.max_pool_size = max_pool_size or int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+        self.wait_queue_timeout_ms = wait_queue_timeout_ms or int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "2000"))
+        self.server_selection_timeout_ms = server_selection_timeout_ms or int(
+            os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000")
+        )
+        self.client_options = client_options
+        self.stats_listener = PoolStats()
+        self._client = None
+        self._pid = None
+        self._lock = threading.Lock()
+        _pools.add(self)
+
+    def client(self):
+        if self._client is None or self._pid != os.getpid():
+            with self._lock:
+                if self._client is None or self._pid != os.getpid():
+                    self._client = MongoClient(
+                        self.uri,
+                        maxPoolSize=self.max_pool_size,
+                        waitQueueTimeoutMS=self.wait_queue_timeout_ms,
+                        serverSelectionTimeoutMS=self.server_selection_timeout_ms,
+                        event_listeners=[self.stats_listener],
+                        **self.client_options
+                    )
+                    self._pid = os.getpid()
+        return self._client
+
+    def use_client(self, client):
+        """Serve this process from an existing client, e.g. mongomock in benchmarks"""
+        with self._lock:
+            self._client = client
+            self._pid = os.getpid()
+
+    def database(self, name):
+        return self.client()[name]
+
+    def collection(self, database_name, name):
+        """Return a handle that resolves the collection on this process's client at each use"""
+        return LazyCollection(self, database_name, name)
+
+    def _after_fork(self):
+        # The parent's sockets and monitor threads are unusable in the child
+        self._client = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.stats_listener.reset()
+
+    def close(self):
+        """Close the client, e.g. on process shutdown"""
+        with self._lock:
+            if self._client is not None and self._pid == os.getpid():
+                self._client.close()
+            self._client = None
+            self._pid = None
+
+    def stats(self):
+        listener = self.stats_listener
+        with listener._lock:
+            return {
+                "max_pool_size": self.max_pool_size,
+                "checked_out": listener.checked_out,
+                "max_checked_out": listener.max_checked_out,
+                "saturation": listener.checked_out / self.max_pool_size,
+                "checkouts": listener.checkouts,
+                "checkout_failures": listener.checkout_failures,
+                "checkout_timeouts": listener.checkout_timeouts,
+                "avg_checkout_ms": round(1000 * listener.total_checkout_seconds / listener.checkouts, 3)
+                if listener.checkouts else 0.0,
+                "max_checkout_ms": round(1000 * listener.max_checkout_seconds, 3),
+                "connections_created": listener.connections_created,
+                "connections_closed": listener.connections_closed
+            }
+
+
+class LazyCollection:
+    """Collection handle bound to a MongoPool rather than to one client"""
+
+    def __init__(self, pool, database_name, name):
+        self._pool = pool
+        self._database_name = database_name
+        self._name = name
+
+    def get(self):
+        return self._pool.client()[self._database_name][self._name]
+
+    def __getattr__(self, attribute):
+        return getattr(self.get(), attribute)
+
+    def __repr__(self):
+        return f"LazyCollection({self._database_name}.{self._name})"
+
+
+def _reset_pools_after_fork():
+    for pool in list(_pools):
+        pool._after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_pools_after_fork)
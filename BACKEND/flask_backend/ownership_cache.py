@@ -0,0 +1,140 @@
+import os
+import threading
+import time
+
+from bson import ObjectId
+
+_UNKNOWN = object()
+
+
+class _UserEntry:
+    def __init__(self, expires_at):
+        self.expires_at = expires_at
+        self.owned = set()
+        # Owned conferences whose messages were in the archive when looked up
+        self.archived = set()
+        self.active = _UNKNOWN
+
+
+class ConferenceOwnershipCache:
+    """Short-lived per-process cache of which conferences each user owns.
+
+    Only positive ownership answers are cached, so a conference created by
+    another worker is never reported missing; the cached active conference is
+    what can go stale, for at most ``ttl`` seconds. Writers in this process
+    update the cache directly, and ``watch_changes`` can subscribe to a Mongo
+    change stream so every worker drops entries as soon as conferences change.
+    The lookups also note which conferences are archived, so readers only go
+    to the archive for those.
+    """
+
+    def __init__(self, conferences, ttl=30, max_users=10000):
+        self.conferences = conferences
+        self.ttl = ttl
+        self.max_users = max_users
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._watching = False
+
+    def _entry(self, user_email):
+        # Must be called with self._lock held
+        entry = self._entries.get(user_email)
+        if entry is None or time.monotonic() >= entry.expires_at:
+            if len(self._entries) >= self.max_users:
+                self._entries.clear()
+            entry = self._entries[user_email] = _UserEntry(time.monotonic() + self.ttl)
+        return entry
+
+    def owns(self, user_email, conference_id):
+        """True if the conference exists and belongs to the user"""
+        with self._lock:
+            if conference_id in self._entry(user_email).owned:
+                return True
+
+        conference = self.conferences.find_one(
+            {'_id': ObjectId(conference_id), 'user_email': user_email},
+            {'_id': 1, 'archived': 1}
+        )
+        if not conference:
+            return False
+        with self._lock:
+            entry = self._entry(user_email)
+            entry.owned.add(conference_id)
+            if conference.get('archived'):
+                entry.archived.add(conference_id)
+        return True
+
+    def add_owned(self, user_email, conference_id):
+        with self._lock:
+            self._entry(user_email).owned.add(conference_id)
+
+    def active_conference_id(self, user_email):
+        """Return the id of the user's active conference, or None if there is none"""
+        with self._lock:
+            active = self._entry(user_email).active
+        if active is not _UNKNOWN:
+            return active
+
+        conference = self.conferences.find_one(
+            {'user_email': user_email, 'is_active': True},
+            {'_id': 1, 'archived': 1}
+        )
+        active = str(conference['_id']) if conference else None
+        with self._lock:
+            entry = self._entry(user_email)
+            entry.active = active
+            if active:
+                entry.owned.add(active)
+                if conference.get('archived'):
+                    entry.archived.add(active)
+        return active
+
+    def set_active(self, user_email, conference_id):
+        """Record a conference this process just created or switched to"""
+        with self._lock:
+            entry = self._entry(user_email)
+            entry.active = conference_id
+            entry.owned.add(conference_id)
+
+    def is_archived(self, user_email, conference_id):
+        """True if the owned conference was archived when it was last looked up (call owns() first)"""
+        with self._lock:
+            return conference_id in self._entry(user_email).archived
+
+    def set_rehydrated(self, user_email, conference_id):
+        with self._lock:
+            self._entry(user_email).archived.discard(conference_id)
+
+    def invalidate(self, user_email=None):
+        with self._lock:
+            if user_email is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_email, None)
+
+    def watch_changes(self):
+        """Invalidate users whose conferences change in any worker (needs a replica set)"""
+        if not self._watching and hasattr(os, "register_at_fork"):
+            # Threads do not survive fork, so each preloaded worker starts its own watcher
+            os.register_at_fork(after_in_child=self._start_watch_thread)
+        self._watching = True
+        return self._start_watch_thread()
+
+    def _start_watch_thread(self):
+        thread = threading.Thread(target=self._watch_loop, name="ownership-cache-watch", daemon=True)
+        thread.start()
+        return thread
+
+    def _watch_loop(self):
+        pipeline = [{'$match': {'operationType': {'$in': ['insert', 'update', 'replace', 'delete']}}}]
+        while True:
+            try:
+                with self.conferences.watch(pipeline, full_document='updateLookup') as stream:
+                    for change in stream:
+                        user_email = (change.get('fullDocument') or {}).get('user_email')
+                        # Deletes carry no document, so drop everything to stay safe
+                        self.invalidate(user_email)
+            except Exception as e:
+                print(f"Conference change stream stopped: {str(e)}")
+                self.invalidate()
+                time.sleep(5)
@@ -0,0 +1,173 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+import bcrypt
+from filelock import FileLock, Timeout
+
+from rate_limit import Overloaded
+
+
+def _hash_password(password, rounds):
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds)).decode("utf-8")
+
+
+def _check_password(password_hash, password):
+    return bcrypt.checkpw(password.encode("utf-8"), password_hash.encode("utf-8"))
+
+
+def hash_rounds(password_hash):
+    """Cost factor of a bcrypt hash ("$2b$12$..." -> 12), or None if it is not one"""
+    try:
+        return int(password_hash.split("$")[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+class HostSlots:
+    """At most ``count`` holders at a time across every process on the host.
+
+    Each slot is a lock file in ``directory``; acquiring tries them in turn
+    and polls until one is free or the timeout passes. The locks are released
+    by the OS if a process dies while holding one.
+    """
+
+    def __init__(self, directory, count, poll_interval=0.005):
+        os.makedirs(directory, exist_ok=True)
+        self.paths = [os.path.join(directory, f"slot-{index}.lock") for index in range(count)]
+        self.poll_interval = poll_interval
+
+    def acquire(self, timeout):
+        """Return a held FileLock, or None if no slot freed up within timeout seconds"""
+        deadline = time.monotonic() + timeout
+        while True:
+            for path in self.paths:
+                lock = FileLock(path)
+                try:
+                    lock.acquire(timeout=0)
+                    return lock
+                except Timeout:
+                    continue
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(self.poll_interval)
+
+
+class PasswordHasher:
+    """bcrypt hashing and checking off the request threads.
+
+    Work runs in a small process pool (``workers`` processes per app worker)
+    and every hash holds one of the host-wide ``host_slots``, so a burst of
+    logins uses at most that many cores however many gunicorn workers there
+    are. No more than ``max_pending`` calls per process may be queued or
+    running: beyond that, or when no slot frees up within ``timeout`` seconds,
+    callers get Overloaded (503) straight away. With ``workers=0`` hashing runs
+    in the calling thread, under the same limits (for gevent workers, where a
+    process pool does not fit).
+
+    The pool is started on first use in each process, from a forkserver so the
+    children do not inherit the app's threads and sockets.
+    """
+
+    def __init__(self, rounds=12, workers=1, max_pending=4, timeout=10.0, host_slots=None):
+        self.rounds = rounds
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.host_slots = host_slots
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self._pending = 0
+        self._completed = 0
+        self._rejected = 0
+        self._timeouts = 0
+        self._total_seconds = 0.0
+
+    def _get_executor(self):
+        if self._executor is None or self._pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._pid != os.getpid():
+                    methods = multiprocessing.get_all_start_methods()
+                    context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+                    self._pid = os.getpid()
+        return self._executor
+
+    def _run(self, function, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise Overloaded("password_hashing", 1)
+
+        started = time.perf_counter()
+        host_slot = None
+        with self._lock:
+            self._pending += 1
+        try:
+            if self.host_slots is not None:
+                host_slot = self.host_slots.acquire(self.timeout)
+                if host_slot is None:
+                    with self._lock:
+                        self._timeouts += 1
+                    raise Overloaded("password_hashing", max(1, round(self.timeout)))
+            if self.workers <= 0:
+                return function(*args)
+            executor = self._get_executor()
+            remaining = max(0.0, self.timeout - (time.perf_counter() - started))
+            try:
+                return executor.submit(function, *args).result(timeout=remaining)
+            except TimeoutError:
+                with self._lock:
+                    self._timeouts += 1
+                raise Overloaded("password_hashing", max(1, round(self.timeout)))
+            except BrokenProcessPool:
+                # A pool worker died; start a fresh pool on the next call
+                with self._lock:
+                    if self._executor is executor:
+                        self._executor = None
+                raise
+        finally:
+            if host_slot is not None:
+                host_slot.release()
+            with self._lock:
+                self._pending -= 1
+                self._completed += 1
+                self._total_seconds += time.perf_counter() - started
+            self._slots.release()
+
+    def hash(self, password):
+        """bcrypt hash of password at the configured cost, as a str"""
+        return self._run(_hash_password, password, self.rounds)
+
+    def check(self, password_hash, password):
+        return self._run(_check_password, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """True when the hash was made with a different cost than the configured one"""
+        rounds = hash_rounds(password_hash)
+        return rounds is not None and rounds != self.rounds
+
+    def close(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None and self._pid == os.getpid():
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "rounds": self.rounds,
+                "workers": self.workers,
+                "host_slots": len(self.host_slots.paths) if self.host_slots is not None else None,
+                "max_pending": self.max_pending,
+                "pending": self._pending,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "timeouts": self._timeouts,
+                "avg_ms": self._total_seconds / self._completed * 1000 if self._completed else 0.0
+            }
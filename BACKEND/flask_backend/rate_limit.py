@@ -0,0 +1,256 @@
+import contextlib
+import math
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ReturnDocument
+
+
+class LimitExceeded(Exception):
+    """A request was turned away; ``status`` and ``retry_after`` (seconds) shape the response"""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f"{name} limit exceeded, retry after {retry_after}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class RateLimited(LimitExceeded):
+    status = 429
+
+
+class Overloaded(LimitExceeded):
+    status = 503
+
+
+def parse_rate_limits(spec):
+    """Parse "name=per_minute:burst,..." into {name: (per_minute, burst)}"""
+    limits = {}
+    for item in (spec or "").split(","):
+        if not item.strip():
+            continue
+        name, _, value = item.partition("=")
+        per_minute, _, burst = value.partition(":")
+        limits[name.strip()] = (float(per_minute), int(burst or per_minute))
+    return limits
+
+
+def parse_concurrency_limits(spec):
+    """Parse "name=max_concurrent:max_waiting,..." into {name: (max_concurrent, max_waiting)}"""
+    limits = {}
+    for item in (spec or "").split(","):
+        if not item.strip():
+            continue
+        name, _, value = item.partition("=")
+        max_concurrent, _, max_waiting = value.partition(":")
+        limits[name.strip()] = (int(max_concurrent), int(max_waiting or 0))
+    return limits
+
+
+class MongoWindowStore:
+    """Shared request counters so every worker enforces the same per-user limit.
+
+    Counts requests in fixed windows with one upserted document per key and
+    window; a TTL index on ``expires_at`` removes old windows. Less smooth than
+    a token bucket (up to twice the burst across a window boundary) but a
+    single round trip per request.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def hit(self, key, window):
+        """Count a request for key; returns (requests in the current window, seconds until it ends)"""
+        now = time.time()
+        window_start = math.floor(now / window) * window
+        document = self.collection.find_one_and_update(
+            {"_id": f"{key}:{int(window_start)}"},
+            {
+                "$inc": {"count": 1},
+                "$setOnInsert": {
+                    "expires_at": datetime.fromtimestamp(window_start, timezone.utc) + timedelta(seconds=window)
+                }
+            },
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return document["count"], window_start + window - now
+
+
+class RateLimiter:
+    """Per-key token buckets for named limits (e.g. per-user chat requests).
+
+    ``limits`` maps a name to (requests per minute, burst). Buckets live in
+    process memory, bounded to ``max_keys`` with least recently used keys
+    dropped. With a ``store`` (MongoWindowStore) the counts are shared by all
+    workers instead: each limit becomes a window of burst / rate seconds that
+    admits ``burst`` requests, the same long-run rate.
+    """
+
+    def __init__(self, limits, store=None, max_keys=10000):
+        self.limits = limits
+        self.store = store
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self._allowed = 0
+        self._limited = 0
+
+    def _take_local(self, name, key, per_minute, burst):
+        rate = per_minute / 60
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop((name, key), (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[(name, key)] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, (1 - tokens) / rate if not allowed else 0
+
+    def _take_shared(self, name, key, per_minute, burst):
+        window = burst / (per_minute / 60)
+        count, remaining = self.store.hit(f"{name}:{key}", window)
+        return count <= burst, remaining
+
+    def check(self, name, key):
+        """Spend one request of ``name`` for ``key``; raises RateLimited when none is left"""
+        if name not in self.limits:
+            return
+        per_minute, burst = self.limits[name]
+        take = self._take_shared if self.store is not None else self._take_local
+        allowed, retry_after = take(name, key, per_minute, burst)
+        with self._lock:
+            if allowed:
+                self._allowed += 1
+            else:
+                self._limited += 1
+        if not allowed:
+            raise RateLimited(name, max(1, math.ceil(retry_after)))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "allowed": self._allowed,
+                "limited": self._limited,
+                "tracked_keys": len(self._buckets)
+            }
+
+
+class ConcurrencyLimit:
+    """Caps in-flight calls to one upstream, with a short bounded wait queue.
+
+    Up to ``max_concurrent`` callers hold a slot at once. Up to ``max_waiting``
+    more wait at most ``wait_timeout`` seconds for one; anyone beyond that, or
+    still waiting at the timeout, gets Overloaded straight away instead of
+    tying up a worker. Retry-After is estimated from how long slots are held.
+    """
+
+    def __init__(self, name, max_concurrent, max_waiting=0, wait_timeout=5.0):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_waiting = max_waiting
+        self.wait_timeout = wait_timeout
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._waiting = 0
+        self._max_in_flight = 0
+        self._admitted = 0
+        self._rejected_queue_full = 0
+        self._rejected_timeout = 0
+        self._total_wait = 0.0
+        self._total_hold = 0.0
+        self._released = 0
+
+    def _retry_after(self):
+        average_hold = self._total_hold / self._released if self._released else 1.0
+        return max(1, math.ceil(average_hold * (self._waiting + 1) / self.max_concurrent))
+
+    def acquire(self):
+        """Take a slot, waiting briefly if needed; raises Overloaded otherwise"""
+        started = time.monotonic()
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                if self._waiting >= self.max_waiting:
+                    self._rejected_queue_full += 1
+                    raise Overloaded(self.name, self._retry_after())
+                self._waiting += 1
+            acquired = self._slots.acquire(timeout=self.wait_timeout)
+            with self._lock:
+                self._waiting -= 1
+                if not acquired:
+                    self._rejected_timeout += 1
+                    raise Overloaded(self.name, self._retry_after())
+
+        now = time.monotonic()
+        with self._lock:
+            self._in_flight += 1
+            self._max_in_flight = max(self._max_in_flight, self._in_flight)
+            self._admitted += 1
+            self._total_wait += now - started
+        return now
+
+    def release(self, acquired_at):
+        with self._lock:
+            self._in_flight -= 1
+            self._released += 1
+            self._total_hold += time.monotonic() - acquired_at
+        self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_concurrent": self.max_concurrent,
+                "max_waiting": self.max_waiting,
+                "in_flight": self._in_flight,
+                "waiting": self._waiting,
+                "max_in_flight": self._max_in_flight,
+                "admitted": self._admitted,
+                "rejected_queue_full": self._rejected_queue_full,
+                "rejected_timeout": self._rejected_timeout,
+                "avg_wait_ms": self._total_wait / self._admitted * 1000 if self._admitted else 0.0,
+                "avg_hold_ms": self._total_hold / self._released * 1000 if self._released else 0.0
+            }
+
+
+class ConcurrencyLimits:
+    """One ConcurrencyLimit per upstream name; unknown names are not limited"""
+
+    def __init__(self, limits, wait_timeout=5.0):
+        self._limits = {
+            name: ConcurrencyLimit(name, max_concurrent, max_waiting, wait_timeout)
+            for name, (max_concurrent, max_waiting) in limits.items()
+        }
+
+    def acquire(self, name):
+        """Take a slot for ``name``; returns a release() callable (a no-op when unlimited)"""
+        limit = self._limits.get(name)
+        if limit is None:
+            return lambda: None
+        acquired_at = limit.acquire()
+        released = threading.Event()
+
+        def release():
+            if not released.is_set():
+                released.set()
+                limit.release(acquired_at)
+
+        return release
+
+    @contextlib.contextmanager
+    def slot(self, name):
+        """Hold a slot for ``name`` for the duration of a call"""
+        release = self.acquire(name)
+        try:
+            yield
+        finally:
+            release()
+
+    def stats(self):
+        return {name: limit.stats() for name, limit in self._limits.items()}
+
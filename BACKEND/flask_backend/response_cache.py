@@ -0,0 +1,117 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class _InflightCall:
+    """A load that other threads asking for the same key can wait on"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class ResponseCache:
+    """Bounded LRU cache with per-entry TTLs and request coalescing.
+
+    Empty results are cached for ``negative_ttl`` seconds instead of ``ttl``.
+    While a key is being loaded, concurrent callers for the same key wait for
+    that load instead of starting their own ("singleflight").
+    """
+
+    def __init__(self, max_entries=1024, ttl=3600, negative_ttl=300,
+                 is_empty=None, is_cacheable=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.is_empty = is_empty or (lambda value: not value)
+        self.is_cacheable = is_cacheable or (lambda value: value is not None)
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def _lookup(self, key):
+        # Must be called with self._lock held
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value, negative = entry
+        if time.monotonic() >= expires_at:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _store(self, key, value):
+        # Must be called with self._lock held
+        negative = self.is_empty(value)
+        ttl = self.negative_ttl if negative else self.ttl
+        self._entries[key] = (time.monotonic() + ttl, value, negative)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def get_or_load(self, key, loader):
+        """Return the cached value for key, calling loader() at most once on a miss"""
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is not None:
+                if entry[2]:
+                    self.negative_hits += 1
+                else:
+                    self.hits += 1
+                return entry[1]
+
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = _InflightCall()
+                self._inflight[key] = call
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        try:
+            call.value = loader()
+            with self._lock:
+                if self.is_cacheable(call.value):
+                    self._store(key, call.value)
+            return call.value
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            call.event.set()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.negative_hits + self.misses + self.coalesced
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "negative_hits": self.negative_hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits + self.negative_hits) / lookups if lookups else 0.0
+            }
@@ -0,0 +1,113 @@
+import threading
+import time
+
+import numpy as np
+
+
+def load_sentence_embedder(model_name="all-MiniLM-L6-v2"):
+    """Return a text -> vector function backed by sentence-transformers.
+
+    The model is the same one the intent service uses; it is imported lazily so
+    the backend does not need it installed unless the cache is enabled.
+    """
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(model_name)
+    return lambda text: model.encode(text)
+
+
+class SemanticCache:
+    """Reuse chatbot replies for messages that mean nearly the same thing.
+
+    Messages are embedded with ``embedder`` (any callable returning a vector, so
+    tests can pass a stub) and compared by cosine similarity against earlier
+    messages sent in the same output mode. A match at or above ``threshold``
+    returns the earlier reply. Entries expire after ``ttl`` seconds and the
+    oldest are dropped once ``max_entries`` is reached.
+    """
+
+    def __init__(self, embedder, threshold=0.92, ttl=24 * 60 * 60, max_entries=2048):
+        self.embedder = embedder
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # Per output mode: parallel lists of unit vectors, replies and expiry times
+        self._vectors = {}
+        self._replies = {}
+        self._expiry = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize_text(text):
+        return " ".join(text.lower().split())
+
+    def _embed(self, text):
+        vector = np.asarray(self.embedder(self.normalize_text(text)), dtype=np.float32).ravel()
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _drop_expired(self, output_mode):
+        # Must be called with self._lock held
+        expiry = self._expiry.get(output_mode)
+        if not expiry:
+            return
+        now = time.monotonic()
+        keep = [index for index, expires_at in enumerate(expiry) if expires_at > now]
+        if len(keep) == len(expiry):
+            return
+        self._vectors[output_mode] = self._vectors[output_mode][keep]
+        self._replies[output_mode] = [self._replies[output_mode][index] for index in keep]
+        self._expiry[output_mode] = [expiry[index] for index in keep]
+
+    def lookup(self, output_mode, message):
+        """Return (reply, vector) where reply is None on a miss.
+
+        The vector can be passed back to ``store`` to avoid embedding twice.
+        """
+        vector = self._embed(message)
+        with self._lock:
+            self._drop_expired(output_mode)
+            vectors = self._vectors.get(output_mode)
+            if vectors is not None and len(vectors):
+                similarities = vectors @ vector
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    self.hits += 1
+                    return self._replies[output_mode][best], vector
+            self.misses += 1
+        return None, vector
+
+    def store(self, output_mode, message, reply, vector=None):
+        if vector is None:
+            vector = self._embed(message)
+        with self._lock:
+            vectors = self._vectors.get(output_mode)
+            if vectors is None:
+                vectors = np.empty((0, vector.shape[0]), dtype=np.float32)
+            replies = self._replies.setdefault(output_mode, [])
+            expiry = self._expiry.setdefault(output_mode, [])
+
+            if len(replies) >= self.max_entries:
+                # Entries are appended in insertion order, so the oldest come first
+                overflow = len(replies) - self.max_entries + 1
+                vectors = vectors[overflow:]
+                del replies[:overflow]
+                del expiry[:overflow]
+
+            self._vectors[output_mode] = np.vstack([vectors, vector[np.newaxis, :]])
+            replies.append(reply)
+            expiry.append(time.monotonic() + self.ttl)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": sum(len(replies) for replies in self._replies.values()),
+                "max_entries_per_mode": self.max_entries,
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
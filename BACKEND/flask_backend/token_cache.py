@@ -0,0 +1,88 @@
+import json
+import os
+import tempfile
+import threading
+import time
+
+from filelock import FileLock
+
+
+class TokenCache:
+    """Expiry-aware cache for an OAuth access token.
+
+    The token is kept in memory and mirrored to a small JSON file so every
+    worker process on the host can reuse it. Refreshes are serialized with a
+    thread lock inside a process and a file lock across processes, so a burst
+    of requests with an expired token results in a single upstream call.
+    """
+
+    def __init__(self, fetch_token, path, refresh_margin=60):
+        # fetch_token() must return (access_token, expires_in_seconds) or (None, 0)
+        self.fetch_token = fetch_token
+        self.path = path
+        self.refresh_margin = refresh_margin
+        self._lock = threading.Lock()
+        self._file_lock = FileLock(path + ".lock")
+        self._token = None
+        self._expires_at = 0.0
+
+    def _is_fresh(self, expires_at):
+        # Treat the token as stale a little before it really expires
+        return time.time() < expires_at - self.refresh_margin
+
+    def _read_shared(self):
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+            return data.get("access_token"), float(data.get("expires_at", 0))
+        except (OSError, ValueError):
+            return None, 0.0
+
+    def _write_shared(self, token, expires_at):
+        directory = os.path.dirname(self.path) or "."
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".token-")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump({"access_token": token, "expires_at": expires_at}, f)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def get(self):
+        """Return a valid access token, refreshing it if needed"""
+        if self._token and self._is_fresh(self._expires_at):
+            return self._token
+
+        with self._lock:
+            # Another thread may have refreshed while we waited
+            if self._token and self._is_fresh(self._expires_at):
+                return self._token
+
+            with self._file_lock:
+                # Another worker may have refreshed while we waited
+                token, expires_at = self._read_shared()
+                if token and self._is_fresh(expires_at):
+                    self._token, self._expires_at = token, expires_at
+                    return token
+
+                token, expires_in = self.fetch_token()
+                if not token:
+                    return None
+
+                expires_at = time.time() + float(expires_in or 0)
+                self._token, self._expires_at = token, expires_at
+                try:
+                    self._write_shared(token, expires_at)
+                except OSError as e:
+                    print(f"Could not share access token: {str(e)}")
+                return token
+
+    def invalidate(self):
+        """Drop the cached token, e.g. after the upstream rejected it"""
+        with self._lock:
+            self._token, self._expires_at = None, 0.0
+            with self._file_lock:
+                if os.path.exists(self.path):
+                    os.unlink(self.path)
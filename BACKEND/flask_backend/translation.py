@@ -0,0 +1,185 @@
+import threading
+from collections import OrderedDict
+
+# langid codes that Google Translate spells differently
+GOOGLE_LANGUAGE_CODES = {
+    "zh": "zh-CN",
+    "he": "iw",
+    "jv": "jw",
+}
+LANGID_LANGUAGE_CODES = {google.split("-")[0].lower(): code for code, google in GOOGLE_LANGUAGE_CODES.items()}
+
+# Languages detection may answer with (langid codes). Keeping the set to what
+# users actually write stops langid from picking look-alike languages for
+# short messages.
+DEFAULT_LANGUAGES = (
+    "en", "es", "fr", "de", "it", "pt", "nl", "ru", "uk", "pl", "tr", "ar", "fa", "ur", "hi", "bn",
+    "pa", "gu", "mr", "ta", "te", "kn", "ml", "zh", "ja", "ko", "id", "vi", "th", "sw"
+)
+
+
+class TranslationLayer:
+    """Language detection and translation for the multilingual chat path.
+
+    Detection runs locally with langid, restricted to ``languages``. Below
+    ``min_confidence`` the local guess stands if it is the default language
+    (short English messages rarely score high) or the user's last detected
+    language; any other unsure guess goes to ``remote_detector`` when one is
+    configured, and falls back to the default language otherwise. English
+    text is never sent for translation, and translations are memoized in a
+    bounded LRU per (source, target) pair so fixed strings like intent
+    responses are only translated once.
+    """
+
+    def __init__(self, translator_factory=None, memo_size=1024, min_confidence=0.8, default_language="en",
+                 languages=DEFAULT_LANGUAGES, remote_detector=None, max_users=10000):
+        if translator_factory is None:
+            from deep_translator import GoogleTranslator
+
+            translator_factory = lambda source, target: GoogleTranslator(source=source, target=target)
+        self.translator_factory = translator_factory
+        self.memo_size = memo_size
+        self.min_confidence = min_confidence
+        self.default_language = default_language
+        self.languages = tuple(languages)
+        self.remote_detector = remote_detector
+        self.max_users = max_users
+        self._identifier = None
+        self._identifier_lock = threading.Lock()
+        self._last_language = OrderedDict()
+        self._memo = {}
+        self._lock = threading.Lock()
+        self.memo_hits = 0
+        self.memo_misses = 0
+        self.unsure_detections = 0
+        self.remote_detections = 0
+
+    def _classify(self, text):
+        if self._identifier is None:
+            # Request threads may get here together; load the model once
+            with self._identifier_lock:
+                if self._identifier is None:
+                    from langid.langid import LanguageIdentifier, model
+
+                    identifier = LanguageIdentifier.from_modelstring(model, norm_probs=True)
+                    identifier.set_languages(self.languages)
+                    self._identifier = identifier
+        return self._identifier.classify(text)
+
+    def _detect_remotely(self, text):
+        try:
+            language = self.remote_detector(text)
+        except Exception as e:
+            print(f"Remote language detection failed: {str(e)}")
+            return None
+        with self._lock:
+            self.remote_detections += 1
+        # Accept Google's spellings too ("zh-CN", "iw")
+        language = (language or "").strip().lower().split("-")[0]
+        language = LANGID_LANGUAGE_CODES.get(language, language)
+        return language if language in self.languages else None
+
+    def last_language(self, user_id):
+        with self._lock:
+            return self._last_language.get(user_id)
+
+    def _remember_language(self, user_id, language):
+        with self._lock:
+            self._last_language[user_id] = language
+            self._last_language.move_to_end(user_id)
+            while len(self._last_language) > self.max_users:
+                self._last_language.popitem(last=False)
+
+    def detect(self, text, user_id=None):
+        """Return the language code of text.
+
+        An unsure local guess is kept when it is the default language or the
+        user's last language; otherwise the remote detector decides, and
+        without one the default language is used.
+        """
+        if not text or not text.strip():
+            return self.default_language
+        language, confidence = self._classify(text)
+        if confidence < self.min_confidence:
+            with self._lock:
+                self.unsure_detections += 1
+            if language != self.default_language and language != self.last_language(user_id):
+                remote = self._detect_remotely(text) if self.remote_detector is not None else None
+                if remote is None:
+                    return self.default_language
+                language = remote
+        if user_id is not None:
+            self._remember_language(user_id, language)
+        return GOOGLE_LANGUAGE_CODES.get(language, language)
+
+    def _memo_for(self, source, target):
+        # Must be called with self._lock held
+        return self._memo.setdefault((source, target), OrderedDict())
+
+    def _remember(self, source, target, text, translated):
+        with self._lock:
+            memo = self._memo_for(source, target)
+            memo[text] = translated
+            memo.move_to_end(text)
+            while len(memo) > self.memo_size:
+                memo.popitem(last=False)
+
+    def _recall(self, source, target, text):
+        with self._lock:
+            memo = self._memo_for(source, target)
+            if text in memo:
+                memo.move_to_end(text)
+                self.memo_hits += 1
+                return memo[text]
+            self.memo_misses += 1
+            return None
+
+    def translate(self, text, source, target):
+        if source == target or not text or not text.strip():
+            return text
+        translated = self._recall(source, target, text)
+        if translated is None:
+            translated = self.translator_factory(source, target).translate(text)
+            self._remember(source, target, text, translated)
+        return translated
+
+    def translate_many(self, texts, source, target):
+        """Translate several strings, sending only the ones not memoized in one batch"""
+        if source == target:
+            return list(texts)
+        results = [None] * len(texts)
+        pending = []
+        for position, text in enumerate(texts):
+            if not text or not text.strip():
+                results[position] = text
+                continue
+            translated = self._recall(source, target, text)
+            if translated is None:
+                pending.append(position)
+            else:
+                results[position] = translated
+
+        if pending:
+            batch = [texts[position] for position in pending]
+            translated_batch = self.translator_factory(source, target).translate_batch(batch)
+            for position, translated in zip(pending, translated_batch):
+                results[position] = translated
+                self._remember(source, target, texts[position], translated)
+        return results
+
+    def to_english(self, text, source):
+        return self.translate(text, source, "en")
+
+    def from_english(self, text, target):
+        return self.translate(text, "en", target)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "language_pairs": len(self._memo),
+                "memo_entries": sum(len(memo) for memo in self._memo.values()),
+                "memo_hits": self.memo_hits,
+                "memo_misses": self.memo_misses,
+                "unsure_detections": self.unsure_detections,
+                "remote_detections": self.remote_detections
+            }
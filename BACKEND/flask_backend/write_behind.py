@@ -0,0 +1,189 @@
+import atexit
+import os
+import queue
+import threading
+import time
+import weakref
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+
+DUPLICATE_KEY = 11000
+
+_queues = weakref.WeakSet()
+
+
+class WriteBehindQueue:
+    """Buffer append-only inserts and write them in batches off the request path.
+
+    ``insert`` assigns the document's ``_id`` up front and returns it right
+    away; a background thread groups queued documents by collection and writes
+    them with ``insert_many(ordered=False)`` once ``max_batch`` are waiting or
+    ``flush_interval`` seconds have passed. When ``max_queue`` documents are
+    already waiting the caller blocks for up to ``put_timeout`` seconds and
+    then writes synchronously, so a slow database pushes back on producers
+    instead of growing memory. The queue is flushed at interpreter exit.
+
+    Records are readable only once flushed, so use this for logs and other
+    writes that are not read back immediately.
+    """
+
+    def __init__(self, max_batch=500, flush_interval=0.2, max_queue=10000, put_timeout=1.0, max_retries=3):
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.put_timeout = put_timeout
+        self.max_retries = max_retries
+        self._lock = threading.Lock()
+        self._reset()
+        self.batches = 0
+        self.written = 0
+        self.failed = 0
+        self.sync_writes = 0
+        _queues.add(self)
+        atexit.register(self.close)
+
+    def _reset(self):
+        self._queue = queue.Queue(self.max_queue)
+        self._stopping = threading.Event()
+        self._worker = None
+        self._pid = os.getpid()
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="write-behind", daemon=True)
+                self._worker.start()
+
+    def insert(self, collection, document):
+        """Queue one document for insertion and return its _id"""
+        document.setdefault("_id", ObjectId())
+        self._ensure_worker()
+        try:
+            self._queue.put((collection, document), timeout=self.put_timeout)
+        except queue.Full:
+            with self._lock:
+                self.sync_writes += 1
+            self._write_collection(collection, [document])
+        return document["_id"]
+
+    def insert_many(self, collection, documents):
+        return [self.insert(collection, document) for document in documents]
+
+    def _collect_batch(self):
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.max_batch:
+            remaining = 0 if self._stopping.is_set() else deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            if batch:
+                self._write(batch)
+            elif self._stopping.is_set():
+                return
+
+    def _write(self, batch):
+        groups = {}
+        for collection, document in batch:
+            groups.setdefault(id(collection), (collection, []))[1].append(document)
+        try:
+            for collection, documents in groups.values():
+                self._write_collection(collection, documents)
+            with self._lock:
+                self.batches += 1
+        finally:
+            for _ in batch:
+                self._queue.task_done()
+
+    def _write_collection(self, collection, documents):
+        for attempt in range(self.max_retries + 1):
+            try:
+                collection.insert_many(documents, ordered=False)
+                with self._lock:
+                    self.written += len(documents)
+                return
+            except BulkWriteError as e:
+                # A retried batch may have partly landed already; those ids show up as duplicates
+                errors = [error for error in e.details.get("writeErrors", []) if error.get("code") != DUPLICATE_KEY]
+                with self._lock:
+                    self.written += len(documents) - len(errors)
+                    self.failed += len(errors)
+                for error in errors[:3]:
+                    print(f"Write-behind insert failed: {error.get('errmsg')}")
+                return
+            except Exception as e:
+                if attempt == self.max_retries:
+                    with self._lock:
+                        self.failed += len(documents)
+                    print(f"Write-behind dropped {len(documents)} documents: {str(e)}")
+                    return
+                time.sleep(min(0.1 * 2 ** attempt, 2.0))
+
+    def flush(self):
+        """Block until everything queued so far has been written"""
+        if self._worker is not None and self._pid == os.getpid() and self._worker.is_alive():
+            self._queue.join()
+        else:
+            self._drain()
+
+    def _drain(self):
+        while True:
+            try:
+                batch = [self._queue.get_nowait()]
+            except queue.Empty:
+                return
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._write(batch)
+
+    def close(self):
+        """Write out the queue and stop the worker thread"""
+        if self._pid != os.getpid():
+            return
+        self._stopping.set()
+        worker = self._worker
+        if worker is not None and worker.is_alive():
+            worker.join()
+        self._drain()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "max_queue": self.max_queue,
+                "batches": self.batches,
+                "written": self.written,
+                "failed": self.failed,
+                "sync_writes": self.sync_writes,
+                "avg_batch_size": self.written / self.batches if self.batches else 0.0
+            }
+
+
+def _reset_queues_after_fork():
+    # Documents queued in the parent are written by the parent
+    for write_queue in list(_queues):
+        write_queue._reset()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_queues_after_fork)
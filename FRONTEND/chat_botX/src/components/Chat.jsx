@@ -11,12 +11,17 @@ import Draggable from 'react-draggable';
 // Import the ElevenLabs API functions
 import { uploadVoiceClone, textToSpeech } from "../utils/elevenlabs";
 
+// Messages fetched per history page; older ones load on demand
+const HISTORY_PAGE_SIZE = 50;
+
 const ChatPage = () => {
   const [messages, setMessages] = useState([
     { role: "bot", content: "Hello! How can I assist you today?" },
   ]);
 
   const [input, setInput] = useState("");
+  // Cursor for the next (older) page of history, null once it is all loaded
+  const [historyCursor, setHistoryCursor] = useState(null);
   const [showEmojiPicker, setShowEmojiPicker] = useState(false);
   const [recording, setRecording] = useState(false);
   const [recognition, setRecognition] = useState(null);
@@ -320,22 +325,43 @@ const ChatPage = () => {
   
 
 
+  // Fetch one page of chat history, newest first; pass a cursor to load older messages
+  const fetchHistoryPage = async (conferenceId, before = null) => {
+    const token = localStorage.getItem("token");
+    const params = { limit: HISTORY_PAGE_SIZE };
+    if (before) params.before = before;
+    const response = await axios.get(
+      `${import.meta.env.VITE_BACKEND_URL}/get_chat_history/${conferenceId}`,
+      { headers: { Authorization: `Bearer ${token}` }, params }
+    );
+    setHistoryCursor(response.headers["x-next-cursor"] || null);
+    return response.data;
+  };
+
   // Fetch chat history from server
   const fetchChatHistory = async () => {
     const token = localStorage.getItem("token");
     if (!token || !activeConference) return;
 
     try {
-      const response = await axios.get(
-        `${import.meta.env.VITE_BACKEND_URL}/get_chat_history/${activeConference}`,
-        { headers: { Authorization: `Bearer ${token}` } }
-      );
-      setMessages(response.data);
+      setMessages(await fetchHistoryPage(activeConference));
     } catch (error) {
       console.error("Error fetching chat history:", error);
     }
   };
 
+  // Prepend the next page of older messages
+  const loadEarlierMessages = async () => {
+    if (!activeConference || !historyCursor) return;
+
+    try {
+      const older = await fetchHistoryPage(activeConference, historyCursor);
+      setMessages((prev) => [...older, ...prev]);
+    } catch (error) {
+      console.error("Error fetching earlier messages:", error);
+    }
+  };
+
   // Delete message from chat history
   const handleDeleteMessage = async (messageId, event) => {
     // Prevent event bubbling
@@ -450,28 +476,14 @@ const ChatPage = () => {
       
       const botResponse = response.data.response;
 
-      // Store messages with conference ID
-      await axios.post(
-        `${import.meta.env.VITE_BACKEND_URL}/store_message`,
-        { 
-          message: input, 
-          role: "user",
-          conference_id: activeConference
-        },
-        { headers: { Authorization: `Bearer ${token}` } }
+      // Both messages are stored by /gemini_chat; attach their ids so they can be deleted
+      setMessages((prev) =>
+        prev.map((msg) =>
+          msg === userMessage ? { ...msg, _id: response.data.user_message_id } : msg
+        )
       );
   
-      await axios.post(
-        `${import.meta.env.VITE_BACKEND_URL}/store_message`,
-        { 
-          message: botResponse, 
-          role: "bot",
-          conference_id: activeConference
-        },
-        { headers: { Authorization: `Bearer ${token}` } }
-      );
-  
-      const newBotMessage = { role: "bot", content: botResponse };
+      const newBotMessage = { _id: response.data.bot_message_id, role: "bot", content: botResponse };
       setMessages((prev) => [...prev, newBotMessage]);
 
       if (preferences.outputMode === "voice") {
@@ -562,13 +574,8 @@ const ChatPage = () => {
   };
 
   const fetchConferenceMessages = async (conferenceId) => {
-    const token = localStorage.getItem('token');
     try {
-      const response = await axios.get(
-        `${import.meta.env.VITE_BACKEND_URL}/get_chat_history/${conferenceId}`,
-        { headers: { Authorization: `Bearer ${token}` } }
-      );
-      setMessages(response.data);
+      setMessages(await fetchHistoryPage(conferenceId));
     } catch (error) {
       console.error('Error fetching messages:', error);
     }
@@ -1005,6 +1012,16 @@ const ChatPage = () => {
           {/* Messages Area */}
           <div className="flex-1 overflow-y-auto p-6">
             <div className="space-y-4">
+              {historyCursor && (
+                <div className="flex justify-center">
+                  <button
+                    onClick={loadEarlierMessages}
+                    className="text-sm text-purple-600 hover:text-purple-800"
+                  >
+                    Load earlier messages
+                  </button>
+                </div>
+              )}
               <AnimatePresence>
                 {messages.map((msg, index) => (
                   <motion.div